@@ -11,7 +11,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE' ,
 
 import django
 django.setup()
-from rango.models import Category, Page
+from rango.models import Page
+from rango import catalog
 
 def populate():
  # First, we will create lists of dictionaries containing the pages we want to add into each category.
@@ -55,37 +56,24 @@ def populate():
     #If you want to add more pages or categories, add them to the dictionaries above.
     #NOTE: cat stands for category not an actual cat.
   
-    # The code below goes through the cats dictionary, then adds each category,
-    # and then adds all the associated pages for that category.
-    # if you are using Python 2.x then use cats.iteritems() see
-    # http://docs.quantifiedcode.com/python-anti-patterns/readability/
-    # for more information about how to iterate over a dictionary properly.
-    
-  for cat, cat_data in cats.items():
-      views = cat_data["views"]
-      likes = cat_data["likes"]
-      c = add_cat(cat, views, likes)    
-      for p in cat_data["pages"]:
-          add_page(c, p["title"], p["url"], p["views"])
+    # The records below are fed through the same batched import that
+    # "python manage.py import_catalog" uses, so each category is followed
+    # by its pages and everything is written with a handful of bulk inserts.
+    
+  catalog.import_records(records(cats))
           
     #Print out the categories that we added.
-  for c in Category.objects.all():
-      for p in Page.objects.filter(category=c):
-            print("- {0} - {1}".format(str(c), str(p)))
-    
-def add_page(cat, title, url, views=0):
-    p = Page.objects.get_or_create(category=cat, title=title)[0]
-    p.url=url
-    p.views=views
-    p.save()
-    return p
-
-def add_cat(name, views=0, likes=0):
-    c = Category.objects.get_or_create(name=name)[0]
-    c.views=views
-    c.likes=likes
-    c.save()
-    return c
+    #One query for all of them, not one per category.
+  for p in Page.objects.select_related('category').order_by('category', 'id'):
+      print("- {0} - {1}".format(str(p.category), str(p)))
+    
+def records(cats):
+    for cat, cat_data in cats.items():
+        yield {"type": "category", "name": cat,
+               "views": cat_data["views"], "likes": cat_data["likes"]}
+        for p in cat_data["pages"]:
+            yield {"type": "page", "category": cat, "title": p["title"],
+                   "url": p["url"], "views": p["views"]}
 
 #Start execution here!
 if __name__ == '__main__':
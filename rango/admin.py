@@ -1,17 +1,56 @@
 from django.contrib import admin
-from rango.models import Category, Page, UserProfile
+from rango.models import Category, CategoryLike, Page, UserProfile
+from rango.pagination import EstimatedCountPaginator
 
 #Customisation below
-class CategoryAdmin(admin.ModelAdmin):
+#The changelists are meant to stay fast on tables with millions of rows:
+#related objects are joined rather than fetched per row, foreign keys are
+#picked from a searchable popup instead of a <select> of every row, the
+#totals are estimated and searches are prefix matches on indexed columns.
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    #Searched as a case sensitive prefix with a range condition, which
+    #any index on the field can serve. The LIKE the admin normally runs
+    #can't use one on SQLite.
+    prefix_search_field = None
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not self.prefix_search_field or not term:
+            return super(LargeTableAdmin, self).get_search_results(
+                request, queryset, search_term)
+        field = self.prefix_search_field
+        return queryset.filter(**{field + '__gte': term,
+                                  field + '__lt': term + '\U0010ffff'}), False
+
+class CategoryAdmin(LargeTableAdmin):
     prepopulated_fields = {'slug':('name',)}
+    list_display = ("name", "views", "likes")
+    search_fields = ("name",)
+    prefix_search_field = "name"
 
-class PageAdmin(admin.ModelAdmin):
+class PageAdmin(LargeTableAdmin):
     fields =["category", "title", "url", "views"]
     list_display = ("title","category", "url")
+    list_select_related = ("category",)
+    raw_id_fields = ("category",)
+    search_fields = ("title",)
+    prefix_search_field = "title"
+
+class CategoryLikeAdmin(LargeTableAdmin):
+    list_display = ("user", "category")
+    list_select_related = ("user", "category")
+    raw_id_fields = ("user", "category")
+
+class UserProfileAdmin(LargeTableAdmin):
+    list_display = ("user", "website")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
 
 # Register your models here.
 
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Page, PageAdmin)
-admin.site.register(UserProfile)
-
+admin.site.register(UserProfile, UserProfileAdmin)
+admin.site.register(CategoryLike, CategoryLikeAdmin)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only JSON API for categories and pages.
+
+    /rango/api/categories/                    every category, by id
+    /rango/api/categories/<slug>/             one category
+    /rango/api/categories/<slug>/pages/       its pages, most viewed first
+    /rango/api/pages/<id>/                    one page
+
+Listings take ?after=<cursor> (the "next" value of the previous response)
+and ?limit=, and are streamed row by row. Every endpoint takes ?fields= to
+fetch and return only some columns. Rows come straight from values()
+queries, no model instances are built. Responses carry an ETag and a
+matching If-None-Match gets a 304.
+"""
+
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.views.decorators.http import require_safe
+from rango.models import Category, Page
+from rango import page_cache, pagination
+
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'views', 'likes')
+PAGE_FIELDS = ('id', 'category', 'title', 'url', 'views')
+
+CATEGORY_ORDERING = ('id',)
+PAGE_ORDERING = ('-views', '-id')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+class BadRequest(Exception):
+    pass
+
+def _dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+def _error(message, status):
+    return HttpResponse(_dumps({'error': message}), status=status,
+                        content_type='application/json')
+
+def _fields(request, allowed):
+    requested = [f for f in request.GET.get('fields', '').split(',') if f]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise BadRequest("Unknown fields: %s. Choose from: %s." %
+                         (', '.join(unknown), ', '.join(allowed)))
+    return requested or list(allowed)
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("limit must be a number.")
+    return max(1, min(limit, MAX_LIMIT))
+
+def _with_etag(request, etag, make_response):
+    if page_cache.etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = make_response()
+    response['ETag'] = etag
+    return response
+
+def _json(request, data):
+    content = _dumps(data).encode('utf-8')
+    return _with_etag(request, page_cache.content_etag(content),
+                      lambda: HttpResponse(content,
+                                           content_type='application/json'))
+
+def _listing_etag(request, tags):
+    #Listings are streamed, so we can't hash the body. Instead the tag is
+    #made of the request and the versions of the data it reads. Counters
+    #change without bumping versions, the time bucket bounds how long a
+    #listing with stale counts keeps its tag.
+    bucket = int(time.time() // max(1, getattr(
+        settings, 'RANGO_PAGE_CACHE_TIMEOUT', 300)))
+    raw = '%s|%s|%d' % (request.get_full_path(),
+                        sorted(page_cache.tag_versions(tags).items()), bucket)
+    return '"%s"' % hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _stream(queryset, fields, ordering, limit):
+    #Writes {"results": [...], "next": cursor} one row at a time. One row
+    #more than asked for is read to know whether there's a next page.
+    keys = [key.lstrip('-') for key in ordering]
+    rows = queryset.values(*set(fields) | set(keys))[:limit + 1].iterator()
+    yield '{"results": ['
+    last = None
+    count = 0
+    more = False
+    for row in rows:
+        if count == limit:
+            more = True
+            break
+        yield (',' if count else '') + \
+            _dumps(dict((field, row[field]) for field in fields))
+        last = row
+        count += 1
+    cursor = pagination.encode_cursor(last, ordering) if more else None
+    yield '], "next": %s}' % _dumps(cursor)
+
+def _listing(request, queryset, allowed, ordering, tags):
+    fields = _fields(request, allowed)
+    limit = _limit(request)
+    after = pagination.decode_cursor(request.GET.get('after'), ordering)
+    queryset = pagination.seek(queryset, ordering, after)
+    return _with_etag(request, _listing_etag(request, tags),
+                      lambda: StreamingHttpResponse(
+                          _stream(queryset, fields, ordering, limit),
+                          content_type='application/json'))
+
+def api_view(view):
+    view = require_safe(view)
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as e:
+            return _error(str(e), 400)
+        except (Category.DoesNotExist, Page.DoesNotExist):
+            return _error("Not found.", 404)
+    return wrapped
+
+@api_view
+def category_list(request):
+    return _listing(request, Category.objects.all(), CATEGORY_FIELDS,
+                    CATEGORY_ORDERING, ['categories'])
+
+@api_view
+def category_detail(request, category_name_slug):
+    fields = _fields(request, CATEGORY_FIELDS)
+    return _json(request, Category.objects.values(*fields)
+                                          .get(slug=category_name_slug))
+
+@api_view
+def category_pages(request, category_name_slug):
+    category_id = Category.objects.values_list('id', flat=True) \
+                                  .get(slug=category_name_slug)
+    return _listing(request, Page.objects.filter(category_id=category_id),
+                    PAGE_FIELDS, PAGE_ORDERING,
+                    ['category:%d' % category_id])
+
+@api_view
+def page_detail(request, page_id):
+    fields = _fields(request, PAGE_FIELDS)
+    return _json(request, Page.objects.values(*fields).get(id=page_id))
@@ -3,3 +3,12 @@ from django.apps import AppConfig
 
 class RangoConfig(AppConfig):
     name = 'rango'
+
+    def ready(self):
+        #Importing the module connects the signal receivers.
+        from rango import signals  # noqa: F401
+        
+        from django.conf import settings
+        if getattr(settings, 'RANGO_TEMPLATE_CACHE', False):
+            from rango import templating
+            templating.warm()
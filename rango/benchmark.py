@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Per-view benchmarks over synthetic catalogs.
+
+generate_catalog() builds a catalog of a given number of pages in which
+both category sizes and page views follow a Zipf distribution, the way real
+catalogs have a few huge categories and a long tail of tiny ones. It goes
+through the normal import path. run_scenarios() then drives each view
+through the test client and reports latency percentiles, queries per
+request and peak Python memory. The benchmark management command wraps
+both and runs every scale against a throwaway test database.
+"""
+
+import itertools
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.template import engines
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rango.models import Category
+from rango import catalog, category_cache
+
+def zipf_weights(n, s):
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+def catalog_records(pages, categories, s=1.1, max_views=100000, seed=0):
+    #Yields import records for a catalog of the given size. Category k (by
+    #size) gets a share of the pages proportional to 1 / k**s, and a page's
+    #views are max_views / rank**s for a random rank.
+    rng = random.Random(seed)
+    for c in range(categories):
+        yield {'type': 'category', 'name': 'Category %d' % c,
+               'likes': int(max_views / (c + 1) ** s) // 10}
+    weights = list(itertools.accumulate(zipf_weights(categories, s)))
+    ranks = list(range(1, pages + 1))
+    rng.shuffle(ranks)
+    for i, rank in enumerate(ranks):
+        c = rng.choices(range(categories), cum_weights=weights)[0]
+        yield {'type': 'page', 'category': 'Category %d' % c,
+               'title': 'Page %d' % i,
+               'url': 'http://example.com/%d/%d' % (c, i),
+               'views': int(max_views / rank ** s)}
+
+def generate_catalog(pages, categories=None, s=1.1, seed=0, batch_size=5000):
+    if categories is None:
+        categories = max(10, pages // 100)
+    return catalog.import_records(catalog_records(pages, categories, s,
+                                                  seed=seed),
+                                  batch_size=batch_size)
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+def _measure(name, action, requests):
+    #Runs action(i) requests times, then once more under tracemalloc, since
+    #tracing would skew the timings.
+    timings = []
+    queries = 0
+    for i in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            action(i)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries += len(captured)
+    tracemalloc.start()
+    try:
+        action(requests)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'scenario': name,
+            'requests': requests,
+            'mean_ms': sum(timings) / len(timings),
+            'p50_ms': percentile(timings, 50),
+            'p90_ms': percentile(timings, 90),
+            'p99_ms': percentile(timings, 99),
+            'max_ms': max(timings),
+            'queries': queries / float(requests),
+            'peak_kib': peak / 1024.0}
+
+def _check(response, *statuses):
+    if response.status_code not in statuses:
+        raise AssertionError("%s returned %d" % (response.request['PATH_INFO'],
+                                                 response.status_code))
+
+def run_scenarios(requests=50, only=None):
+    #Benchmarks every view against whatever catalog is in the database.
+    client = Client()
+    sizes = list(Category.objects.order_by('-likes')
+                         .values_list('slug', flat=True))
+    biggest, median, smallest = sizes[0], sizes[len(sizes) // 2], sizes[-1]
+    user = User.objects.create_user('benchmark', password='benchmark-pass')
+    author = Client()
+    author.force_login(user)
+    sidebar = engines['django'].from_string(
+        '{% load rango_template_tags %}{% get_category_list %}')
+    run = '%d' % time.time()
+
+    def category(slug):
+        url = reverse('show_category', args=[slug])
+        return lambda i: _check(client.get(url), 200)
+
+    def add_page(i):
+        _check(author.post(reverse('add_page', args=[median]),
+                           {'title': 'Bench %s %d' % (run, i),
+                            'url': 'http://bench.example.com/%s/%d' % (run, i),
+                            'views': 0}), 200, 302)
+
+    def register(i):
+        _check(client.post(reverse('register'),
+                           {'username': 'bench%s%d' % (run, i),
+                            'email': 'bench%d@example.com' % i,
+                            'password': 'benchmark-pass'}), 200)
+
+    def sidebar_cold(i):
+        category_cache.invalidate()
+        sidebar.render({})
+
+    scenarios = [
+        ('index', lambda i: _check(client.get(reverse('index')), 200)),
+        ('show_category:largest', category(biggest)),
+        ('show_category:median', category(median)),
+        ('show_category:smallest', category(smallest)),
+        ('add_page', add_page),
+        ('register', register),
+        ('sidebar:cold', sidebar_cold),
+        ('sidebar:warm', lambda i: sidebar.render({})),
+    ]
+    results = []
+    for name, action in scenarios:
+        if only and not any(name.startswith(o) for o in only):
+            continue
+        cache.clear()
+        results.append(_measure(name, action, requests))
+    return results
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming import and export of the Category/Page catalog.
+
+Input is a stream of records, one per JSON line or CSV row:
+
+    {"type": "category", "name": "Python", "views": 128, "likes": 64}
+    {"type": "page", "category": "Python", "title": "Official Python Tutorial",
+     "url": "http://docs.python.org/2/tutorial/", "views": 81}
+
+CSV files use the same names as column headers, and either may be gzipped.
+"type" may be left out, a record with a title is a page. Records are read
+lazily and written in batches: the categories a batch refers to are
+upserted by slug with one lookup and one bulk insert, then its pages are
+bulk inserted, all in one transaction. Pages whose url their category
+already has (see rango.urlnorm) are skipped and counted as duplicates.
+Memory use depends on the batch size, not the input size.
+
+export_catalog() writes the same format back out, every category and then
+every page, read in keyset batches so memory use doesn't grow with the
+table sizes either.
+"""
+
+import csv
+import gzip
+import io
+import json
+import time
+import zlib
+
+from django.db import transaction
+from django.template.defaultfilters import slugify
+from rango.models import Category, Page
+from rango import (category_cache, leaderboard, page_cache, pagination,
+                   urlnorm)
+
+FORMATS = ('jsonl', 'csv')
+FIELDS = ('type', 'category', 'name', 'title', 'url', 'views', 'likes')
+
+#Slug -> id lookups are remembered across batches, up to this many.
+MAX_KNOWN_CATEGORIES = 100000
+CHUNK_SIZE = 500
+
+class ImportStats(object):
+    def __init__(self):
+        self.rows = 0
+        self.categories = 0
+        self.pages = 0
+        self.duplicates = 0
+        self.started = time.time()
+
+    @property
+    def seconds(self):
+        return time.time() - self.started
+
+    @property
+    def rate(self):
+        return self.rows / max(self.seconds, 1e-6)
+
+def _int(value):
+    if value in (None, ''):
+        return None
+    return int(value)
+
+def _normalise(record):
+    record = dict((k, v) for k, v in record.items() if k in FIELDS)
+    if not record.get('type'):
+        record['type'] = 'page' if record.get('title') else 'category'
+    if record['type'] == 'category' and not record.get('name'):
+        record['name'] = record.get('category')
+    record['views'] = _int(record.get('views'))
+    record['likes'] = _int(record.get('likes'))
+    return record
+
+def read_records(stream, format='jsonl'):
+    #Yields records from a text stream one at a time.
+    if format == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    elif format == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+    else:
+        raise ValueError("Unknown catalog format %r" % format)
+
+def open_text(binary):
+    #Gzipped input is recognised by its magic number.
+    if hasattr(binary, 'peek') and binary.peek(2)[:2] == b'\x1f\x8b':
+        binary = gzip.GzipFile(fileobj=binary)
+    return io.TextIOWrapper(binary, encoding='utf-8', newline='')
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _slug_ids(slugs):
+    #SQLite limits how many parameters one statement can take.
+    found = {}
+    for i in range(0, len(slugs), CHUNK_SIZE):
+        found.update(Category.objects.filter(slug__in=slugs[i:i + CHUNK_SIZE])
+                                     .values_list('slug', 'id'))
+    return found
+
+def _upsert_categories(batch, known, stats):
+    #Makes sure every category the batch mentions exists and known maps
+    #its slug to its id.
+    names = {}
+    counters = {}
+    for record in batch:
+        if record['type'] == 'category':
+            name = record['name']
+            counters[slugify(name)] = (record['views'], record['likes'])
+        else:
+            name = record['category']
+        names.setdefault(slugify(name), name)
+
+    lookup = [slug for slug in names if slug not in known]
+    if lookup:
+        found = _slug_ids(lookup)
+        new = []
+        for slug in lookup:
+            if slug not in found:
+                views, likes = counters.pop(slug, (None, None))
+                #bulk_create() skips Category.save(), so set the slug here.
+                new.append(Category(name=names[slug], slug=slug,
+                                    views=views or 0, likes=likes or 0))
+        if new:
+            Category.objects.bulk_create(new)
+            stats.categories += len(new)
+            #SQLite doesn't hand back the new ids, fetch them in one go.
+            found.update(_slug_ids([c.slug for c in new]))
+        if len(known) + len(found) > MAX_KNOWN_CATEGORIES:
+            #Start again from the slugs this batch refers to, its pages and
+            #counters still need the ones that were already known.
+            kept = dict((slug, known[slug]) for slug in names if slug in known)
+            known.clear()
+            known.update(kept)
+        known.update(found)
+
+    #Counters given for categories that already existed.
+    for slug, (views, likes) in counters.items():
+        values = {}
+        if views is not None:
+            values['views'] = views
+        if likes is not None:
+            values['likes'] = likes
+        if values:
+            Category.objects.filter(id=known[slug]).update(**values)
+
+def _existing_urls(pages):
+    #The (category, url_hash) pairs among pages that are already stored,
+    #probing the index for each chunk rather than reading the categories.
+    found = set()
+    for i in range(0, len(pages), CHUNK_SIZE // 2):
+        chunk = pages[i:i + CHUNK_SIZE // 2]
+        found.update(Page.objects
+                     .filter(category_id__in=set(p.category_id for p in chunk),
+                             url_hash__in=set(p.url_hash for p in chunk))
+                     .values_list('category_id', 'url_hash'))
+    return found
+
+def _insert_pages(batch, known, stats):
+    #bulk_create() skips Page.save(), so set the url hash here.
+    pages = [Page(category_id=known[slugify(record['category'])],
+                  title=record['title'], url=record['url'],
+                  url_hash=urlnorm.url_hash(record['url']),
+                  views=record['views'] or 0)
+             for record in batch if record['type'] == 'page']
+    #Urls a category already has, or that appeared earlier in the input,
+    #are skipped.
+    seen = _existing_urls(pages)
+    new = []
+    for page in pages:
+        key = (page.category_id, page.url_hash)
+        if key not in seen:
+            seen.add(key)
+            new.append(page)
+    Page.objects.bulk_create(new)
+    stats.pages += len(new)
+    stats.duplicates += len(pages) - len(new)
+
+def import_records(records, batch_size=1000, progress=None):
+    #Imports an iterable of records, calling progress(stats) after every
+    #batch. Returns the final ImportStats.
+    stats = ImportStats()
+    known = {}
+    for batch in _batches((_normalise(r) for r in records), batch_size):
+        with transaction.atomic():
+            _upsert_categories(batch, known, stats)
+            _insert_pages(batch, known, stats)
+        stats.rows += len(batch)
+        if progress:
+            progress(stats)
+    #Bulk writes don't send model signals, so refresh the derived data.
+    category_cache.invalidate()
+    page_cache.invalidate('categories', 'pages')
+    leaderboard.categories.invalidate()
+    leaderboard.pages.invalidate()
+    leaderboard.request_rebuild()
+    return stats
+
+def _keyset_rows(queryset, fields, batch_size):
+    #Every row of the queryset in id order, one bounded query per batch.
+    after = None
+    while True:
+        batch = list(pagination.seek(queryset, ('id',), after)
+                               .values('id', *fields)[:batch_size])
+        for row in batch:
+            yield row
+        if len(batch) < batch_size:
+            return
+        after = [batch[-1]['id']]
+
+def export_records(batch_size=1000):
+    #Yields every category and then every page as import records.
+    for row in _keyset_rows(Category.objects.all(), ('name', 'views', 'likes'),
+                            batch_size):
+        yield {'type': 'category', 'name': row['name'],
+               'views': row['views'], 'likes': row['likes']}
+    for row in _keyset_rows(Page.objects.all(),
+                            ('category__name', 'title', 'url', 'views'),
+                            batch_size):
+        yield {'type': 'page', 'category': row['category__name'],
+               'title': row['title'], 'url': row['url'], 'views': row['views']}
+
+def write_records(records, format='jsonl', lines_per_chunk=500):
+    #Yields the records as chunks of utf-8 text in the given format.
+    if format not in FORMATS:
+        raise ValueError("Unknown catalog format %r" % format)
+    buffer = io.StringIO()
+    writer = None
+    if format == 'csv':
+        writer = csv.DictWriter(buffer, FIELDS)
+        writer.writeheader()
+    lines = 0
+    for record in records:
+        if writer is None:
+            buffer.write(json.dumps(record) + '\n')
+        else:
+            writer.writerow(record)
+        lines += 1
+        if lines >= lines_per_chunk:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            lines = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def compress(chunks, level=6):
+    #Gzips a stream of byte chunks as it goes.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_catalog(format='jsonl', gzipped=False, batch_size=1000):
+    #The whole catalog as an iterator of byte chunks, for a file or a
+    #streaming response. import_records() reads it back.
+    chunks = write_records(export_records(batch_size), format)
+    if gzipped:
+        chunks = compress(chunks)
+    return chunks
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Cached, lightweight views of the Category table.
+
+Anything that only needs the id, name and slug of every category (the
+sidebar in particular) should come through here instead of running
+Category.objects.all(). Every cached entry is keyed on a version number
+kept in the cache; saving or deleting a Category bumps that version once the
+transaction commits, so later lookups miss the stale copies. The version is
+only shared between processes when CACHES is (memcached, redis); with the
+default per-process LocMemCache each worker only sees its own writes until
+RANGO_CATEGORY_CACHE_TIMEOUT runs out.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from rango.models import Category
+
+VERSION_KEY = 'rango:categories:version'
+LIST_KEY = 'rango:categories:list:{0}'
+SIDEBAR_KEY = 'rango:categories:sidebar:{0}:{1}'
+
+#What views need to know about a category to show it or link to it.
+CategoryRef = namedtuple('CategoryRef', 'id name slug')
+
+_lock = threading.Lock()
+_slug_map = {}
+_slug_map_version = None
+
+def _timeout():
+    return getattr(settings, 'RANGO_CATEGORY_CACHE_TIMEOUT', 3600)
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        #Seed from the clock so a version key that was evicted can never
+        #come back with a number an older entry is still stored under.
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+def invalidate():
+    global _slug_map_version
+    with _lock:
+        _slug_map_version = None
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        #The key was never set or has been evicted, either way nothing
+        #cached under the old version can be reached any more.
+        get_version()
+
+def get_category_list():
+    #Returns a list of {'id', 'name', 'slug'} dicts for every category.
+    key = LIST_KEY.format(get_version())
+    cats = cache.get(key)
+    if cats is None:
+        cats = list(Category.objects.order_by('id')
+                                    .values('id', 'name', 'slug'))
+        cache.set(key, cats, _timeout())
+    return cats
+
+def render_sidebar(active_id=None):
+    #Returns the rendered rango/cats.html fragment with the category whose
+    #id is active_id highlighted. One fragment is kept per active category.
+    key = SIDEBAR_KEY.format(get_version(), active_id or 0)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('rango/cats.html',
+                                {'cats': get_category_list(),
+                                 'act_cat_id': active_id})
+        cache.set(key, html, _timeout())
+    return mark_safe(html)
+
+def _lookup(slug):
+    #The database has the last word on slugs the map doesn't know, the
+    #category may have been made by another process. Misses aren't
+    #remembered, so a category made elsewhere shows up straight away.
+    try:
+        c = Category.objects.values('id', 'name', 'slug').get(slug=slug)
+    except Category.DoesNotExist:
+        return None
+    #This process has missed a write, start again from the database.
+    invalidate()
+    return CategoryRef(c['id'], c['name'], c['slug'])
+
+def get_by_slug(slug):
+    #Returns the CategoryRef for slug, or None if there's no such category.
+    #Served from a map kept in this process, which is rebuilt from the
+    #cached category list whenever the version moves on, with a database
+    #lookup for slugs it doesn't have.
+    global _slug_map, _slug_map_version
+    version = get_version()
+    with _lock:
+        slug_map = _slug_map if _slug_map_version == version else None
+    if slug_map is None:
+        slug_map = dict((c['slug'], CategoryRef(c['id'], c['name'], c['slug']))
+                        for c in get_category_list())
+        with _lock:
+            _slug_map = slug_map
+            _slug_map_version = version
+    ref = slug_map.get(slug)
+    return ref if ref is not None else _lookup(slug)
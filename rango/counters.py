@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Buffered view counters for pages and categories.
+
+Recording a view only touches an in-process dict. A background thread
+drains the buffer every RANGO_VIEW_FLUSH_INTERVAL seconds, coalescing the
+pending increments into one UPDATE ... SET views = views + n per distinct
+n, so a burst of hits costs a handful of writes instead of one locked
+read-modify-write save each. Page views also go into the hourly buckets
+rango.trending ranks from. The buffer is also drained as soon as it holds
+RANGO_VIEW_BUFFER_SIZE rows, and once more when the process exits.
+"""
+
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from rango.models import Category, Page
+from rango import leaderboard, trending
+
+logger = logging.getLogger(__name__)
+
+#SQLite refuses statements with more than 999 parameters.
+CHUNK_SIZE = 500
+
+_lock = threading.Lock()
+_pending = {Page: {}, Category: {}}
+_wake = threading.Event()
+_flusher = None
+
+def _flush_interval():
+    return getattr(settings, 'RANGO_VIEW_FLUSH_INTERVAL', 5)
+
+def _buffer_size():
+    return getattr(settings, 'RANGO_VIEW_BUFFER_SIZE', 1000)
+
+def record_page_view(page_id, count=1):
+    _record(Page, page_id, count)
+
+def record_category_view(category_id, count=1):
+    _record(Category, category_id, count)
+
+def pending():
+    #A copy of the increments that have not been written yet.
+    with _lock:
+        return dict((model, dict(counts)) for model, counts in _pending.items())
+
+def _record(model, pk, count):
+    with _lock:
+        counts = _pending[model]
+        counts[pk] = counts.get(pk, 0) + count
+        full = sum(len(c) for c in _pending.values()) >= _buffer_size()
+    if full:
+        flush()
+    else:
+        _start_flusher()
+
+def _take():
+    with _lock:
+        taken = dict((model, counts) for model, counts in _pending.items()
+                     if counts)
+        for model in taken:
+            _pending[model] = {}
+    return taken
+
+def _put_back(model, counts):
+    with _lock:
+        merged = _pending[model]
+        for pk, count in counts.items():
+            merged[pk] = merged.get(pk, 0) + count
+
+def flush():
+    #Writes every pending increment to the database.
+    for model, counts in _take().items():
+        try:
+            _apply(model, counts)
+        except Exception:
+            logger.exception("Failed to flush %d %s view counters, "
+                             "they will be retried.", len(counts),
+                             model.__name__)
+            _put_back(model, counts)
+            continue
+        if model is Page:
+            _refresh_leaderboard(list(counts))
+
+def _chunks(items):
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+def _apply(model, counts):
+    #Group the rows by increment so every distinct increment is one UPDATE.
+    by_count = {}
+    for pk, count in counts.items():
+        by_count.setdefault(count, []).append(pk)
+    with transaction.atomic():
+        for count, pks in by_count.items():
+            for chunk in _chunks(pks):
+                model.objects.filter(pk__in=chunk).update(views=F('views') + count)
+        #Page views also go into this hour's trending buckets.
+        if model is Page:
+            trending.record(counts)
+
+def _refresh_leaderboard(page_ids):
+    for chunk in _chunks(page_ids):
+        for row in Page.objects.filter(pk__in=chunk).values(
+                'id', 'title', 'url', 'views'):
+            leaderboard.pages.update(row['id'], row)
+
+def _run():
+    global _flusher
+    while True:
+        interval = _flush_interval()
+        if not interval:
+            break
+        _wake.wait(interval)
+        _wake.clear()
+        flush()
+        try:
+            trending.maybe_prune()
+        except Exception:
+            logger.exception("Failed to prune the trending buckets.")
+    with _lock:
+        _flusher = None
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None or not _flush_interval():
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run,
+                                        name='rango-view-counters')
+            _flusher.daemon = True
+            _flusher.start()
+
+#Don't lose the increments still in the buffer when the process stops.
+atexit.register(flush)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Primary/replica routing and per-connection database setup.
+
+With RANGO_DB_REPLICA set to a database alias, reads of rango and auth
+models go to that replica and every write goes to 'default'. A thread that
+has written is pinned to the primary for the rest of its work, and
+ReplicaPinningMiddleware carries the pin across the user's following
+requests (for RANGO_REPLICA_PIN_SECONDS) with a cookie, so nobody misses
+their own write because the replica is lagging behind.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+#Apps whose reads may be served by the replica
+ROUTED_APPS = ('rango', 'auth')
+
+PIN_COOKIE = 'rango_primary'
+
+_state = threading.local()
+
+def replica():
+    return getattr(settings, 'RANGO_DB_REPLICA', None)
+
+def pin():
+    _state.pinned = True
+
+def reset():
+    _state.pinned = False
+    _state.wrote = False
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+class PrimaryReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS or is_pinned():
+            return None
+        return replica()
+
+    def db_for_write(self, model, **hints):
+        #Whatever this thread reads next must see the write.
+        if model._meta.app_label in ROUTED_APPS:
+            _state.wrote = True
+            pin()
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        #The replica gets its schema along with its data.
+        if db == replica():
+            return False
+        return None
+
+class ReplicaPinningMiddleware(object):
+    #Sends the request's reads to the primary if it is not a safe method or
+    #the user wrote something in the last few seconds, and starts that
+    #window whenever the request wrote.
+    def __init__(self, get_response):
+        if not replica():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset()
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            pin()
+        else:
+            try:
+                pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+            except ValueError:
+                pinned_until = 0
+            if pinned_until > time.time():
+                pin()
+        try:
+            response = self.get_response(request)
+            if wrote():
+                window = getattr(settings, 'RANGO_REPLICA_PIN_SECONDS', 5)
+                response.set_cookie(PIN_COOKIE, '%.3f' % (time.time() + window),
+                                    max_age=window, httponly=True)
+            return response
+        finally:
+            reset()
+
+def configure_connection(connection):
+    #Run by the connection_created signal each time a connection opens.
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        #WAL lets readers carry on while a write is in progress, and with it
+        #synchronous=NORMAL is still safe against corruption. It is a
+        #lasting change to the database file, so it's opt-in.
+        if getattr(settings, 'RANGO_SQLITE_WAL', False):
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=%d' % getattr(
+            settings, 'RANGO_SQLITE_BUSY_TIMEOUT', 5000))
+        if connection.alias == replica():
+            cursor.execute('PRAGMA query_only=ON')
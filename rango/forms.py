@@ -8,6 +8,7 @@ Created on Wed Feb  6 14:53:57 2019
 from django import forms 
 from rango.models import Page, Category, UserProfile
 from django.contrib.auth.models import User
+from rango import usernames
 
 class CategoryForm(forms.ModelForm):
     name = forms.CharField(max_length=128,
@@ -29,16 +30,19 @@ class PageForm(forms.ModelForm):
                             help_text="Please enter the URL of the page.")
     views = forms.IntegerField(widget=forms.HiddenInput(), initial=0)
     
-    #Method that appends 'http://' to the front of a url if it isn't there.
+    #Method that appends 'http://' to the front of a url if it has no
+    #scheme. Whether the category already has the page is checked by
+    #Page.validate_unique, so build the form with instance=Page(category=...).
     def clean(self):
-        cleaned_data = self.cleaned_data
+        #ModelForm.clean() switches on the uniqueness checks.
+        cleaned_data = super(PageForm, self).clean()
         url = cleaned_data.get('url')
         
-        if url and not url.startswith('http://'):
+        if url and not url.startswith(('http://', 'https://')):
             url = 'http://' + url
             cleaned_data['url'] = url
             
-            return cleaned_data
+        return cleaned_data
     
     
     #Basically the same as the Meta class in CategoryForm
@@ -54,6 +58,18 @@ class UserForm(forms.ModelForm):
     class Meta:
         model = User
         fields = ('username', 'email', 'password')
+    
+    #Skips the uniqueness query for usernames the in-memory filter knows
+    #are free. The database's unique constraint still has the last word.
+    def validate_unique(self):
+        exclude = self._get_validation_exclusions()
+        username = self.cleaned_data.get('username')
+        if username and not usernames.might_exist(username):
+            exclude.append('username')
+        try:
+            self.instance.validate_unique(exclude=exclude)
+        except forms.ValidationError as e:
+            self._update_errors(e)
         
 class UserProfileForm(forms.ModelForm):
     class Meta:
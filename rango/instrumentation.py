@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Low-overhead hooks for timing database queries and template renders.
+
+install() wraps Django's database cursors and Template.render() once per
+process. The wrappers look up the listeners registered for the current
+thread and do nothing else when there are none, so the cost outside a
+listen() block is a thread-local attribute lookup. Nothing is patched until
+something calls install(), so when no feature uses these hooks they are
+completely free.
+"""
+
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.utils import CursorWrapper, CursorDebugWrapper
+from django.template.base import Template
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+
+def _listeners(kind):
+    return getattr(_local, kind, None)
+
+class _TimedMixin(object):
+    def execute(self, sql, params=None):
+        listeners = _listeners('queries')
+        if not listeners:
+            return super(_TimedMixin, self).execute(sql, params)
+        start = perf_counter()
+        try:
+            return super(_TimedMixin, self).execute(sql, params)
+        finally:
+            duration = perf_counter() - start
+            for listener in listeners:
+                listener(self.db, sql, params, duration)
+
+    def executemany(self, sql, param_list):
+        listeners = _listeners('queries')
+        if not listeners:
+            return super(_TimedMixin, self).executemany(sql, param_list)
+        start = perf_counter()
+        try:
+            return super(_TimedMixin, self).executemany(sql, param_list)
+        finally:
+            duration = perf_counter() - start
+            for listener in listeners:
+                listener(self.db, sql, None, duration)
+
+class TimedCursorWrapper(_TimedMixin, CursorWrapper):
+    pass
+
+class TimedCursorDebugWrapper(_TimedMixin, CursorDebugWrapper):
+    pass
+
+def _make_cursor(self, cursor):
+    return TimedCursorWrapper(cursor, self)
+
+def _make_debug_cursor(self, cursor):
+    return TimedCursorDebugWrapper(cursor, self)
+
+_template_render = Template.render
+
+def _timed_render(self, context):
+    listeners = _listeners('templates')
+    if not listeners:
+        return _template_render(self, context)
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    start = perf_counter()
+    try:
+        return _template_render(self, context)
+    finally:
+        duration = perf_counter() - start
+        _local.depth = depth
+        for listener in listeners:
+            listener(self.name, duration, depth)
+
+def install():
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        BaseDatabaseWrapper.make_cursor = _make_cursor
+        BaseDatabaseWrapper.make_debug_cursor = _make_debug_cursor
+        Template.render = _timed_render
+        _installed = True
+
+@contextmanager
+def listen(queries=None, templates=None):
+    #Calls queries(connection, sql, params, seconds) after every query and
+    #templates(name, seconds, depth) after every template render made by
+    #this thread inside the block. depth is 0 for a top-level render.
+    install()
+    added = []
+    for kind, listener in (('queries', queries), ('templates', templates)):
+        if listener is not None:
+            current = _listeners(kind) or ()
+            setattr(_local, kind, current + (listener,))
+            added.append((kind, current))
+    try:
+        yield
+    finally:
+        for kind, previous in added:
+            setattr(_local, kind, previous)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Incrementally maintained top-N leaderboards for the index page.
+
+Each board keeps the best few rows (plus some slack) in memory together
+with a floor: an upper bound on the score of every row that is not on the
+board. Counter changes are fed in through update() and remove(), which is
+enough to keep the board exact without ever sorting the table again. The
+database is only consulted on a cold start, when deletions or decrements
+leave the board too short to trust, or after request_rebuild().
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rango.models import Category, Page
+
+GENERATION_KEY = 'rango:leaderboards:generation'
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+def _generation():
+    return cache.get(GENERATION_KEY, 0)
+
+def request_rebuild():
+    #Ask every process to reload its boards from the database on the next
+    #lookup. Used by the rebuild_leaderboards management command.
+    cache.add(GENERATION_KEY, 0, None)
+    cache.incr(GENERATION_KEY)
+
+
+class Leaderboard(object):
+    def __init__(self, loader, score_field):
+        #loader(n) must return the n best rows as dicts ordered best first,
+        #each including score_field.
+        self.loader = loader
+        self.score_field = score_field
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._floor = None
+        self._ready = False
+        self._generation = None
+        self._loaded_at = 0
+
+    @property
+    def size(self):
+        return _setting('RANGO_LEADERBOARD_SIZE', 5)
+
+    @property
+    def capacity(self):
+        return self.size + _setting('RANGO_LEADERBOARD_SLACK', 20)
+
+    def _rebuild(self, generation):
+        rows = list(self.loader(self.capacity))
+        self._entries = dict((row['id'], row) for row in rows)
+        if len(rows) < self.capacity:
+            #Everything in the table is on the board.
+            self._floor = None
+        else:
+            self._floor = rows[-1][self.score_field]
+        self._generation = generation
+        self._loaded_at = time.time()
+        self._ready = True
+
+    def _is_stale(self, generation):
+        if not self._ready or generation != self._generation:
+            return True
+        max_age = _setting('RANGO_LEADERBOARD_MAX_AGE', None)
+        return max_age is not None and time.time() - self._loaded_at > max_age
+
+    def _sorted(self):
+        return sorted(self._entries.values(),
+                      key=lambda row: (-row[self.score_field], row['id']))
+
+    def top(self):
+        generation = _generation()
+        with self._lock:
+            if self._is_stale(generation):
+                self._rebuild(generation)
+            return self._sorted()[:self.size]
+
+    def invalidate(self):
+        with self._lock:
+            self._ready = False
+
+    def update(self, obj_id, row):
+        #row is the full payload for obj_id including its new score.
+        score = row[self.score_field]
+        with self._lock:
+            if not self._ready:
+                return
+            if obj_id in self._entries:
+                if self._floor is not None and score < self._floor:
+                    #Something off the board may now outrank it.
+                    del self._entries[obj_id]
+                    self._check_length()
+                else:
+                    self._entries[obj_id] = row
+            elif self._floor is None or score > self._floor:
+                self._entries[obj_id] = row
+                if len(self._entries) > self.capacity:
+                    lowest = self._sorted()[-1]
+                    del self._entries[lowest['id']]
+                    if self._floor is None:
+                        self._floor = lowest[self.score_field]
+                    else:
+                        self._floor = max(self._floor,
+                                          lowest[self.score_field])
+
+    def remove(self, obj_id):
+        with self._lock:
+            if self._entries.pop(obj_id, None) is not None:
+                self._check_length()
+
+    def _check_length(self):
+        #Only called with the lock held.
+        if self._floor is not None and len(self._entries) < self.size:
+            self._ready = False
+
+
+def _load_categories(n):
+    return Category.objects.order_by('-likes', 'id').values(
+            'id', 'name', 'slug', 'likes')[:n]
+
+def _load_pages(n):
+    return Page.objects.order_by('-views', 'id').values(
+            'id', 'title', 'url', 'views')[:n]
+
+categories = Leaderboard(_load_categories, 'likes')
+pages = Leaderboard(_load_pages, 'views')
+
+def top_categories():
+    return categories.top()
+
+def top_pages():
+    return pages.top()
+
+def category_changed(category):
+    if isinstance(category.likes, int):
+        categories.update(category.id, {'id': category.id,
+                                        'name': category.name,
+                                        'slug': category.slug,
+                                        'likes': category.likes})
+    else:
+        #Saved with an F() expression, we don't know the new value.
+        categories.invalidate()
+
+def page_changed(page):
+    if isinstance(page.views, int):
+        pages.update(page.id, {'id': page.id,
+                               'title': page.title,
+                               'url': page.url,
+                               'views': page.views})
+    else:
+        pages.invalidate()
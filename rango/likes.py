@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Category likes.
+
+Each like is a CategoryLike row, unique per user and category, and
+Category.likes is changed with an atomic UPDATE ... likes + 1 only when a
+row was really inserted (or - 1 when one was really deleted), so the count
+stays exact however many clicks race each other. Every user's liked
+category ids are cached as one set, so clicking like on something already
+liked (or unlike on something that isn't) writes nothing. The set is kept
+for RANGO_LIKES_CACHE_TIMEOUT seconds, and dropped whenever a click finds it
+was wrong: with a per-process cache another worker may have made the change.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from rango.models import Category, CategoryLike
+from rango import leaderboard
+
+USER_KEY = 'rango:likes:user:{0}'
+
+def liked_ids(user_id):
+    key = USER_KEY.format(user_id)
+    liked = cache.get(key)
+    if liked is None:
+        liked = frozenset(CategoryLike.objects.filter(user_id=user_id)
+                                              .values_list('category_id',
+                                                           flat=True))
+        cache.set(key, liked, getattr(settings, 'RANGO_LIKES_CACHE_TIMEOUT', 300))
+    return liked
+
+def _forget(user_id):
+    cache.delete(USER_KEY.format(user_id))
+
+def has_liked(user, category_id):
+    return user.is_authenticated and category_id in liked_ids(user.id)
+
+def _changed(user_id, category_id, delta):
+    Category.objects.filter(id=category_id).update(likes=F('likes') + delta)
+    #Drop the cached set rather than patching it, two requests patching it
+    #at once could leave it wrong. Dropped again after the commit in case
+    #another request cached the old set in between.
+    key = USER_KEY.format(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+def like(user, category_id):
+    #Returns True if this click added a like.
+    if category_id in liked_ids(user.id):
+        return False
+    try:
+        with transaction.atomic():
+            CategoryLike.objects.create(user_id=user.id,
+                                        category_id=category_id)
+            _changed(user.id, category_id, 1)
+    except IntegrityError:
+        #Another request from this user got there first, maybe through
+        #another worker, so the cached set is out of date.
+        _forget(user.id)
+        return False
+    _update_leaderboard(category_id)
+    return True
+
+def unlike(user, category_id):
+    #Returns True if this click removed a like.
+    if category_id not in liked_ids(user.id):
+        return False
+    with transaction.atomic():
+        deleted = CategoryLike.objects.filter(
+            user_id=user.id, category_id=category_id).delete()[0]
+        if deleted:
+            _changed(user.id, category_id, -1)
+    if not deleted:
+        #The cached set said liked but it wasn't.
+        _forget(user.id)
+        return False
+    _update_leaderboard(category_id)
+    return True
+
+def likes_of(category_id):
+    return Category.objects.values_list('likes', flat=True).get(id=category_id)
+
+def _update_leaderboard(category_id):
+    row = Category.objects.values('id', 'name', 'slug', 'likes') \
+                          .get(id=category_id)
+    leaderboard.categories.update(category_id, row)
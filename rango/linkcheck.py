@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent health checks for Page.url.
+
+check_links() takes the pages whose last check is older than max_age (never
+checked ones first) and requests each url with a minimal asyncio HTTP/1.1
+client: HEAD, or GET when the server refuses HEAD. At most `concurrency`
+requests are in flight overall and at most `per_host` to any one host, and
+a page waiting for a busy host does not hold up the others. Status, latency
+and check time are written back in batches, one transaction each.
+
+Only the status line is read, so a check costs one round trip and a few
+hundred bytes whatever the size of the page behind the url.
+"""
+
+import asyncio
+import collections
+import ssl
+import time
+from datetime import timedelta
+from urllib.parse import quote, urlsplit
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rango.models import Page, is_dead
+from rango import page_cache
+
+USER_AGENT = 'rango-linkcheck/1.0'
+#Servers that answer HEAD with one of these get a GET instead
+HEAD_REFUSED = (405, 501)
+CHUNK_SIZE = 500
+
+LinkStats = collections.namedtuple('LinkStats', 'checked dead seconds')
+
+def alive(queryset):
+    #Leaves out pages whose last check failed, unchecked ones stay in.
+    return queryset.filter(Q(link_status__isnull=True) |
+                           Q(link_status__gt=0, link_status__lt=400))
+
+def stale_pages(max_age):
+    cutoff = timezone.now() - max_age
+    return (Page.objects
+            .filter(Q(link_checked_at__isnull=True) | Q(link_checked_at__lt=cutoff))
+            .order_by('link_checked_at', 'id'))
+
+async def _request(method, url, timeout):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('Not an http url: %r' % url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    #Non-ascii paths and hosts have to be escaped to go on the wire.
+    path = quote(parts.path or '/', safe="/%:@!$&'()*+,;=~")
+    if parts.query:
+        path += '?' + quote(parts.query, safe="/%:@!$&'()*+,;=~?")
+    host = parts.hostname.encode('idna').decode('ascii')
+    if parts.port is not None:
+        host += ':%d' % parts.port
+
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port,
+                                ssl=ssl.create_default_context() if secure else None),
+        timeout)
+    try:
+        writer.write(('%s %s HTTP/1.1\r\nHost: %s\r\nUser-Agent: %s\r\n'
+                      'Accept: */*\r\nConnection: close\r\n\r\n' %
+                      (method, path, host, USER_AGENT)).encode('latin-1'))
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    finally:
+        writer.close()
+    #"HTTP/1.1 404 Not Found"
+    fields = line.split(None, 2)
+    if len(fields) < 2 or not fields[0].startswith(b'HTTP/'):
+        raise ValueError('Bad status line: %r' % line)
+    return int(fields[1])
+
+async def fetch_status(url, timeout=10):
+    #Returns (status, latency in ms); status is 0 if there was no answer.
+    started = time.perf_counter()
+    try:
+        status = await _request('HEAD', url, timeout)
+        if status in HEAD_REFUSED:
+            status = await _request('GET', url, timeout)
+    except (OSError, ValueError, asyncio.TimeoutError, ssl.SSLError):
+        status = 0
+    return status, int((time.perf_counter() - started) * 1000)
+
+class LinkChecker(object):
+
+    def __init__(self, concurrency=50, per_host=2, timeout=10):
+        self.timeout = timeout
+        self.per_host = per_host
+        self.slots = asyncio.Semaphore(concurrency)
+        self.hosts = collections.defaultdict(lambda: asyncio.Semaphore(per_host))
+
+    async def check(self, url):
+        #Wait for the host first, so queueing behind a busy host doesn't
+        #take one of the global slots.
+        host = (urlsplit(url).hostname or '').lower()
+        async with self.hosts[host]:
+            async with self.slots:
+                return await fetch_status(url, self.timeout)
+
+def _save(results, now):
+    #Returns the categories whose pages changed between alive and dead.
+    changed = set()
+    with transaction.atomic():
+        for page, status, latency in results:
+            Page.objects.filter(id=page['id']).update(
+                link_status=status, link_latency_ms=latency, link_checked_at=now)
+            if is_dead(status) != is_dead(page['link_status']):
+                changed.add(page['category_id'])
+    return changed
+
+async def _check_all(ids, checker, batch_size, progress, stats):
+    results = []
+    changed = set()
+    #Bounds how many pages are held in memory waiting for their host.
+    window = asyncio.Semaphore(max(batch_size, checker.per_host))
+
+    def flush():
+        changed.update(_save(results, timezone.now()))
+        stats['checked'] += len(results)
+        stats['dead'] += sum(1 for result in results if is_dead(result[1]))
+        del results[:]
+        if progress:
+            progress(stats)
+
+    async def check(page):
+        try:
+            status, latency = await checker.check(page['url'])
+            results.append((page, status, latency))
+        finally:
+            window.release()
+
+    tasks = []
+    for start in range(0, len(ids), CHUNK_SIZE):
+        pages = Page.objects.filter(id__in=ids[start:start + CHUNK_SIZE]).values(
+            'id', 'url', 'category_id', 'link_status')
+        for page in pages:
+            await window.acquire()
+            tasks.append(asyncio.ensure_future(check(page)))
+            if len(results) >= batch_size:
+                flush()
+        tasks = [task for task in tasks if not task.done()]
+    if tasks:
+        await asyncio.wait(tasks)
+    if results:
+        flush()
+    return changed
+
+def check_links(max_age=timedelta(days=7), limit=None, concurrency=50,
+                per_host=2, timeout=10, batch_size=200, progress=None):
+    started = time.time()
+    ids = stale_pages(max_age).values_list('id', flat=True)
+    if limit:
+        ids = ids[:limit]
+    ids = list(ids)
+
+    stats = {'checked': 0, 'dead': 0}
+
+    async def main():
+        #The semaphores must be made on the loop that uses them.
+        checker = LinkChecker(concurrency, per_host, timeout)
+        return await _check_all(ids, checker, batch_size, progress, stats)
+
+    loop = asyncio.new_event_loop()
+    try:
+        changed = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    #Updates skip the model signals, so evict the category pages whose dead
+    #links appeared or went away.
+    if changed:
+        page_cache.invalidate(*['category:%d' % id for id in changed])
+    return LinkStats(stats['checked'], stats['dead'], time.time() - started)
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Closed-loop load generator.
+
+Each of N virtual users runs in its own thread and loops until the time is
+up: pick a flow from the weighted mix, run it, optionally think, repeat.
+Flows go through the real stack, sessions, CSRF and all, either in-process
+through tango_with_django_project.wsgi.application (WSGITransport) or over
+HTTP against a running server (HTTPTransport):
+
+    index          GET the index page
+    show_category  GET a random category page
+    register       GET the form, POST a new account
+    login          POST the login form for the user's account, registering
+                   it first if it has none yet
+    add_page       log in if needed, GET the form, POST a new page
+
+Every request is timed under its endpoint name. A request counts as an
+error if it raised, returned a status the flow did not expect or a body
+that shows the flow failed. Lock timeouts ("database is locked") can only
+be seen in-process, from the exception behind the 500.
+"""
+
+import http.client
+import io
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connections
+from rango.benchmark import percentile
+
+FLOWS = ('index', 'show_category', 'login', 'register', 'add_page')
+DEFAULT_MIX = OrderedDict([('index', 40), ('show_category', 40),
+                           ('login', 5), ('register', 5), ('add_page', 10)])
+
+def parse_mix(text):
+    #"index=40,show_category=40,add_page=20" -> {flow: weight}
+    mix = OrderedDict()
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        flow, _, weight = part.partition('=')
+        flow = flow.strip()
+        if flow not in FLOWS:
+            raise ValueError("Unknown flow %r, expected one of %s" %
+                             (flow, ', '.join(FLOWS)))
+        mix[flow] = float(weight or 1)
+    if not mix or not any(mix.values()):
+        raise ValueError("The mix needs at least one flow with a weight")
+    return mix
+
+
+class WSGITransport(object):
+    #Calls the WSGI application directly, no sockets involved.
+    def __init__(self, application=None):
+        if application is None:
+            from tango_with_django_project.wsgi import application
+        self.application = application
+
+    def request(self, method, path, body=b'', headers=()):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query,
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80',
+            'HTTP_HOST': 'testserver', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1', 'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True, 'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key != 'CONTENT_TYPE':
+                key = 'HTTP_' + key
+            environ[key] = value
+        started = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = response_headers
+
+        result = self.application(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started['status'], started['headers'], content
+
+    def close(self):
+        pass
+
+
+class HTTPTransport(object):
+    #One keep-alive connection per virtual user.
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.prefix = parts.path.rstrip('/')
+        cls = (http.client.HTTPSConnection if parts.scheme == 'https'
+               else http.client.HTTPConnection)
+        self.connection = cls(parts.hostname, parts.port, timeout=timeout)
+
+    def request(self, method, path, body=b'', headers=()):
+        try:
+            self.connection.request(method, self.prefix + path, body=body,
+                                    headers=dict(headers))
+            response = self.connection.getresponse()
+            content = response.read()
+        except (http.client.HTTPException, OSError):
+            #Start afresh with a new connection next time.
+            self.connection.close()
+            raise
+        return response.status, response.getheaders(), content
+
+    def close(self):
+        self.connection.close()
+
+
+class Stats(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}
+        self.errors = {}
+        self.lock_timeouts = {}
+
+    def add(self, endpoint, ms, error=False, lock_timeout=False):
+        with self._lock:
+            self.timings.setdefault(endpoint, []).append(ms)
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + bool(error)
+            self.lock_timeouts[endpoint] = (self.lock_timeouts.get(endpoint, 0) +
+                                            bool(lock_timeout))
+
+    def report(self, seconds):
+        rows = []
+        for endpoint in sorted(self.timings):
+            timings = self.timings[endpoint]
+            count = len(timings)
+            rows.append({'endpoint': endpoint,
+                         'requests': count,
+                         'throughput': count / seconds,
+                         'p50_ms': percentile(timings, 50),
+                         'p95_ms': percentile(timings, 95),
+                         'p99_ms': percentile(timings, 99),
+                         'max_ms': max(timings),
+                         'errors': self.errors[endpoint],
+                         'error_rate': self.errors[endpoint] / float(count),
+                         'lock_timeouts': self.lock_timeouts[endpoint],
+                         'lock_timeout_rate':
+                             self.lock_timeouts[endpoint] / float(count)})
+        total = sum(row['requests'] for row in rows)
+        return {'seconds': seconds,
+                'requests': total,
+                'throughput': total / seconds,
+                'errors': sum(row['errors'] for row in rows),
+                'lock_timeouts': sum(row['lock_timeouts'] for row in rows),
+                'endpoints': rows}
+
+
+#The exceptions the current thread's requests raised, for the in-process
+#transport, which gets the 500 response rather than the exception.
+_raised = threading.local()
+
+def _record_exception(sender, request=None, **kwargs):
+    exc = sys.exc_info()[1]
+    if exc is not None and hasattr(_raised, 'exceptions'):
+        _raised.exceptions.append(exc)
+
+def _is_lock_timeout(exc):
+    return isinstance(exc, OperationalError) and 'locked' in str(exc)
+
+
+class VirtualUser(object):
+    def __init__(self, number, transport, stats, slugs, rng, run):
+        self.number = number
+        self.transport = transport
+        self.stats = stats
+        self.slugs = slugs
+        self.rng = rng
+        self.run = run
+        self.cookies = {}
+        self.account = None
+        self.logged_in = False
+        self.serial = 0
+
+    def _unique(self):
+        self.serial += 1
+        return '%s%du%d' % (self.run, self.number, self.serial)
+
+    def request(self, endpoint, method, path, data=None, ok=(200,), check=None):
+        headers = []
+        body = b''
+        if self.cookies:
+            headers.append(('Cookie', '; '.join('%s=%s' % item for item in
+                                                self.cookies.items())))
+        if data is not None:
+            data = dict(data, csrfmiddlewaretoken=self.cookies.get('csrftoken', ''))
+            body = urlencode(data).encode('utf-8')
+            headers.append(('Content-Type', 'application/x-www-form-urlencoded'))
+
+        _raised.exceptions = []
+        error = False
+        content = b''
+        started = time.perf_counter()
+        try:
+            status, response_headers, content = self.transport.request(
+                method, path, body, headers)
+        except Exception as e:
+            _raised.exceptions.append(e)
+            error = True
+            status = None
+        else:
+            for name, value in response_headers:
+                if name.lower() == 'set-cookie':
+                    for morsel in SimpleCookie(value).values():
+                        self.cookies[morsel.key] = morsel.value
+            error = status not in ok or (check is not None and not check(content))
+        ms = (time.perf_counter() - started) * 1000
+        exceptions, _raised.exceptions = _raised.exceptions, []
+        self.stats.add(endpoint, ms, error=error or bool(exceptions),
+                       lock_timeout=any(_is_lock_timeout(e) for e in exceptions))
+        return status, content
+
+    #The flows.
+    def index(self):
+        self.request('index', 'GET', '/rango/')
+
+    def show_category(self):
+        self.request('show_category', 'GET',
+                     '/rango/category/%s/' % self.rng.choice(self.slugs))
+
+    def register(self):
+        self.request('register:form', 'GET', '/rango/register/')
+        username = self._unique()
+        status, content = self.request(
+            'register', 'POST', '/rango/register/',
+            {'username': username, 'email': username + '@example.com',
+             'password': 'load-test-pass'},
+            check=lambda content: b'thank you for registering' in content)
+        if status == 200 and self.account is None:
+            self.account = username
+
+    def login(self):
+        if self.account is None:
+            self.register()
+            if self.account is None:
+                return
+        self.request('login:form', 'GET', '/rango/login/')
+        status, content = self.request(
+            'login', 'POST', '/rango/login/',
+            {'username': self.account, 'password': 'load-test-pass'}, ok=(302,))
+        self.logged_in = status == 302
+
+    def add_page(self):
+        if not self.logged_in:
+            self.login()
+            if not self.logged_in:
+                return
+        path = '/rango/category/%s/add_page/' % self.rng.choice(self.slugs)
+        self.request('add_page:form', 'GET', path)
+        name = self._unique()
+        self.request('add_page', 'POST', path,
+                     {'title': 'Load %s' % name, 'views': 0,
+                      'url': 'http://load.example.com/%s' % name},
+                     check=lambda content: b'id="page_form"' not in content)
+
+    def loop(self, mix, deadline, think):
+        flows, weights = list(mix), list(mix.values())
+        try:
+            while time.time() < deadline:
+                getattr(self, self.rng.choices(flows, weights)[0])()
+                if think:
+                    time.sleep(self.rng.uniform(0, 2 * think))
+        finally:
+            self.transport.close()
+            #Each thread has its own database connections.
+            connections.close_all()
+
+
+def run(transport_factory, slugs, users=10, duration=30, mix=None, think=0,
+        seed=0):
+    #Runs users virtual users for duration seconds and returns the report.
+    #transport_factory() is called once per user. think is the mean pause
+    #between flows in seconds.
+    if not slugs:
+        raise ValueError("The load test needs at least one category")
+    mix = mix or DEFAULT_MIX
+    stats = Stats()
+    tag = 'lt%d' % (time.time() * 1000 % 1e9)
+    got_request_exception.connect(_record_exception)
+    try:
+        deadline = time.time() + duration
+        started = time.time()
+        threads = []
+        for number in range(users):
+            user = VirtualUser(number, transport_factory(), stats, slugs,
+                               random.Random(seed * 10007 + number), tag)
+            thread = threading.Thread(target=user.loop, args=(mix, deadline, think),
+                                      name='rango-loadtest-%d' % number)
+            thread.daemon = True
+            threads.append(thread)
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.time() - started
+    finally:
+        got_request_exception.disconnect(_record_exception)
+    report = stats.report(seconds)
+    report.update(users=users, mix=dict(mix), think=think)
+    return report
@@ -0,0 +1,84 @@
+import json
+import platform
+import subprocess
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from rango import benchmark, counters
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks the rango views against synthetic Zipf-distributed "
+            "catalogs of increasing size, each in a throwaway test "
+            "database. Never touches the real database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000,100000',
+                            help="Comma separated catalog sizes in pages.")
+        parser.add_argument('--requests', type=int, default=50,
+                            help="Requests per scenario.")
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help="Zipf exponent for category sizes and views.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', default='',
+                            help="Comma separated scenario name prefixes.")
+        parser.add_argument('--output',
+                            help="Write the results as JSON to this file.")
+
+    def _revision(self):
+        try:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def handle(self, *args, **options):
+        scales = [int(s) for s in options['scales'].split(',') if s]
+        only = [o for o in options['only'].split(',') if o]
+        report = {'revision': self._revision(),
+                  'started': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                           time.gmtime()),
+                  'python': platform.python_version(),
+                  'django': django.get_version(),
+                  'options': {'requests': options['requests'],
+                              'zipf': options['zipf'],
+                              'seed': options['seed']},
+                  'results': []}
+
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        #The flusher thread would write to the database behind our back.
+        with override_settings(RANGO_VIEW_FLUSH_INTERVAL=None,
+                               DEBUG=False, ALLOWED_HOSTS=['testserver']):
+            for scale in scales:
+                old_config = runner.setup_databases()
+                try:
+                    started = time.time()
+                    stats = benchmark.generate_catalog(
+                        scale, s=options['zipf'], seed=options['seed'])
+                    self.stdout.write("%d pages in %d categories generated "
+                                      "in %.1fs" % (stats.pages,
+                                                    stats.categories,
+                                                    time.time() - started))
+                    for result in benchmark.run_scenarios(options['requests'],
+                                                          only):
+                        result.update(scale=scale,
+                                      categories=stats.categories)
+                        report['results'].append(result)
+                        self.stdout.write(
+                            "  %-24s p50 %8.2fms  p99 %8.2fms  "
+                            "%6.1f queries  %9.1f KiB" % (
+                                result['scenario'], result['p50_ms'],
+                                result['p99_ms'], result['queries'],
+                                result['peak_kib']))
+                    counters.flush()
+                finally:
+                    runner.teardown_databases(old_config)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write("Results written to %s" % options['output'])
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from rango import linkcheck
+
+
+class Command(BaseCommand):
+    help = ("Checks Page urls concurrently and records their HTTP status, "
+            "latency and check time. Only pages not checked within "
+            "--max-age hours are requested, never checked ones first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=float, default=24 * 7,
+                            help="Recheck links older than this many hours.")
+        parser.add_argument('--limit', type=int,
+                            help="Check at most this many pages.")
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--per-host', type=int, default=2,
+                            help="Requests in flight to any one host.")
+        parser.add_argument('--timeout', type=float, default=10,
+                            help="Seconds to wait for connect and response.")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            self.stdout.write("%(checked)d checked, %(dead)d dead" % stats)
+
+        stats = linkcheck.check_links(
+            max_age=timedelta(hours=options['max_age']),
+            limit=options['limit'], concurrency=options['concurrency'],
+            per_host=options['per_host'], timeout=options['timeout'],
+            batch_size=options['batch_size'],
+            progress=progress if options['verbosity'] > 1 else None)
+        self.stdout.write("Checked %d links in %.1fs, %d dead." %
+                          (stats.checked, stats.seconds, stats.dead))
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rango import catalog
+
+
+class Command(BaseCommand):
+    help = ("Streams every category and page to a JSON lines or CSV file "
+            "(or - for standard output) in the format import_catalog reads, "
+            "optionally gzipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=catalog.FORMATS,
+                            help="Defaults to the file extension, or jsonl.")
+        parser.add_argument('--gzip', action='store_true',
+                            help="Compress the output, the default for .gz "
+                                 "paths.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        gzipped = options['gzip'] or path.endswith('.gz')
+        format = options['format']
+        if format is None:
+            stem = path[:-3] if path.endswith('.gz') else path
+            format = 'csv' if stem.endswith('.csv') else 'jsonl'
+
+        chunks = catalog.export_catalog(format, gzipped, options['batch_size'])
+        if path == '-':
+            out = sys.stdout.buffer
+        else:
+            try:
+                out = open(path, 'wb')
+            except IOError as e:
+                raise CommandError(str(e))
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if path == '-':
+                out.flush()
+            else:
+                out.close()
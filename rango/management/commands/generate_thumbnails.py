@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from rango.models import UserProfile
+from rango import thumbnails
+
+
+class Command(BaseCommand):
+    help = ("Makes thumbnails for profile pictures that don't have them yet "
+            "(or for every picture with --all).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Regenerate existing thumbnails too.")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Threads to use, 1 works inline.")
+
+    def _generate(self, profile):
+        try:
+            return thumbnails.generate(profile)
+        except Exception as e:
+            self.stderr.write("%s: %s" % (profile.picture.name, e))
+            return False
+
+    def _generate_in_worker(self, profile):
+        try:
+            return self._generate(profile)
+        finally:
+            connections.close_all()
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(picture='')
+        if not options['all']:
+            profiles = profiles.filter(has_thumbnails=False)
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                done = sum(pool.map(self._generate_in_worker,
+                                    profiles.iterator()))
+        else:
+            done = sum(self._generate(p) for p in profiles.iterator())
+        self.stdout.write("Made thumbnails for %d profile pictures." % done)
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rango import catalog
+
+
+class Command(BaseCommand):
+    help = ("Streams categories and pages from a JSON lines or CSV file, "
+            "gzipped or not (or - for standard input), into the database in "
+            "batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=catalog.FORMATS,
+                            help="Defaults to the file extension, or jsonl.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format']
+        if format is None:
+            stem = path[:-3] if path.endswith('.gz') else path
+            format = 'csv' if stem.endswith('.csv') else 'jsonl'
+
+        if path == '-':
+            stream = catalog.open_text(sys.stdin.buffer)
+        else:
+            try:
+                stream = catalog.open_text(open(path, 'rb'))
+            except IOError as e:
+                raise CommandError(str(e))
+
+        def progress(stats):
+            self.stdout.write("%d rows, %d categories, %d pages "
+                              "(%.0f rows/s)" % (stats.rows, stats.categories,
+                                                 stats.pages, stats.rate))
+
+        with stream:
+            try:
+                stats = catalog.import_records(
+                    catalog.read_records(stream, format),
+                    batch_size=options['batch_size'], progress=progress)
+            except (ValueError, KeyError) as e:
+                raise CommandError("Bad record: %s" % e)
+        self.stdout.write("Imported %d rows in %.1fs (%.0f rows/s), skipped "
+                          "%d duplicate pages." % (stats.rows, stats.seconds,
+                                                   stats.rate, stats.duplicates))
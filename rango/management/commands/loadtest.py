@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from rango.models import Category
+from rango import benchmark, counters, loadtest
+
+
+class Command(BaseCommand):
+    help = ("Drives the site with concurrent virtual users following a "
+            "weighted mix of flows, and reports throughput, latency "
+            "percentiles and error and lock timeout rates per endpoint. "
+            "Runs the WSGI application in-process against a throwaway "
+            "file-backed test database, or a running server with --url.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--duration', type=float, default=30,
+                            help="Seconds to run for.")
+        parser.add_argument('--mix', default=','.join(
+            '%s=%g' % item for item in loadtest.DEFAULT_MIX.items()),
+            help="Comma separated flow=weight pairs, flows are %s." %
+                 ', '.join(loadtest.FLOWS))
+        parser.add_argument('--think', type=float, default=0,
+                            help="Mean pause between a user's flows, in "
+                                 "seconds.")
+        parser.add_argument('--url',
+                            help="Base url of a running server to test, "
+                                 "e.g. http://127.0.0.1:8000. Its categories "
+                                 "are read from the configured database.")
+        parser.add_argument('--catalog', type=int, default=10000,
+                            help="Pages in the synthetic catalog generated "
+                                 "for in-process runs.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output',
+                            help="Write the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        kwargs = dict(users=options['users'], duration=options['duration'],
+                      mix=mix, think=options['think'], seed=options['seed'])
+
+        if options['url']:
+            slugs = list(Category.objects.values_list('slug', flat=True))
+            report = loadtest.run(
+                lambda: loadtest.HTTPTransport(options['url']), slugs, **kwargs)
+        else:
+            report = self._in_process(options, kwargs)
+
+        self._print(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write("Report written to %s" % options['output'])
+
+    def _in_process(self, options, kwargs):
+        #A file rather than SQLite's in-memory test database, so the users'
+        #connections lock each other the way they do in production.
+        directory = tempfile.mkdtemp()
+        test_settings = connections['default'].settings_dict.setdefault('TEST', {})
+        old_name = test_settings.get('NAME')
+        test_settings['NAME'] = os.path.join(directory, 'loadtest.sqlite3')
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+                old_config = runner.setup_databases()
+                try:
+                    stats = benchmark.generate_catalog(options['catalog'],
+                                                       seed=options['seed'])
+                    self.stdout.write("%d pages in %d categories generated." %
+                                      (stats.pages, stats.categories))
+                    slugs = list(Category.objects.values_list('slug', flat=True))
+                    connections.close_all()
+                    report = loadtest.run(loadtest.WSGITransport, slugs, **kwargs)
+                    counters.flush()
+                finally:
+                    runner.teardown_databases(old_config)
+        finally:
+            test_settings['NAME'] = old_name
+            shutil.rmtree(directory, ignore_errors=True)
+        return report
+
+    def _print(self, report):
+        self.stdout.write("%d users, %d requests in %.1fs: %.1f req/s, "
+                          "%d errors, %d lock timeouts" % (
+                              report['users'], report['requests'],
+                              report['seconds'], report['throughput'],
+                              report['errors'], report['lock_timeouts']))
+        self.stdout.write("  %-16s %7s %8s %9s %9s %9s %7s %7s" % (
+            'endpoint', 'reqs', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+            'err %', 'lock %'))
+        for row in report['endpoints']:
+            self.stdout.write("  %-16s %7d %8.1f %9.2f %9.2f %9.2f %7.2f %7.2f" % (
+                row['endpoint'], row['requests'], row['throughput'],
+                row['p50_ms'], row['p95_ms'], row['p99_ms'],
+                100 * row['error_rate'], 100 * row['lock_timeout_rate']))
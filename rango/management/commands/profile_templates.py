@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand
+from rango import templating
+
+
+class Command(BaseCommand):
+    help = ("Renders the rango templates with sample data and reports the "
+            "mean cost of each template and each block.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('templates', nargs='*',
+                            help="Template names, e.g. rango/index.html. "
+                                 "Defaults to all of them.")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--json', action='store_true',
+                            help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        results = templating.profile(options['iterations'],
+                                     options['templates'])
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for kind in ('templates', 'blocks'):
+            self.stdout.write("%s (mean ms per page render, inclusive)" %
+                              kind.capitalize())
+            for name, ms in sorted(results[kind].items(),
+                                   key=lambda item: -item[1]):
+                self.stdout.write("  %9.3f  %s" % (ms, name))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from rango import trending
+
+
+class Command(BaseCommand):
+    help = ("Deletes the hourly page view buckets that have left the "
+            "trending window for good. The view counter flusher does this "
+            "too; run it from cron when that thread is turned off.")
+
+    def handle(self, *args, **options):
+        deleted = trending.prune_expired()
+        self.stdout.write("Pruned %d trending buckets." % deleted)
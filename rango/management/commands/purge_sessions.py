@@ -0,0 +1,44 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ("Deletes expired sessions in small batches, so the session "
+            "table is never locked for long. Engines that don't keep "
+            "sessions in the database are handed to their own "
+            "clear_expired().")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Sessions deleted per statement.")
+        parser.add_argument('--sleep', type=float, default=0,
+                            help="Seconds to pause between batches.")
+
+    def handle(self, *args, **options):
+        engine = import_module(settings.SESSION_ENGINE)
+        store = engine.SessionStore
+        if not issubclass(store, DBStore):
+            store.clear_expired()
+            self.stdout.write("%s doesn't store sessions in the database, "
+                              "nothing to purge." % settings.SESSION_ENGINE)
+            return
+
+        model = store.get_model_class()
+        now = timezone.now()
+        batch_size = max(1, min(options['batch_size'], 900))
+        total = 0
+        while True:
+            keys = list(model.objects.filter(expire_date__lt=now)
+                        .values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                break
+            model.objects.filter(session_key__in=keys).delete()
+            total += len(keys)
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write("Purged %d expired sessions." % total)
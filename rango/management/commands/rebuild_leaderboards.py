@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from rango import leaderboard
+
+
+class Command(BaseCommand):
+    help = ("Makes every running process reload the index page leaderboards "
+            "from the database on its next request.")
+
+    def handle(self, *args, **options):
+        leaderboard.request_rebuild()
+        self.stdout.write("Leaderboard rebuild requested.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from rango import search
+
+
+class Command(BaseCommand):
+    help = ("Recreates the full-text search tables and triggers if they are "
+            "missing and rebuilds the index from the page and category "
+            "tables.")
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stderr.write("Full-text search needs the SQLite backend.")
+            return
+        search.rebuild_index()
+        self.stdout.write("Search index rebuilt.")
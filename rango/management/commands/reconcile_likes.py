@@ -0,0 +1,33 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.core.management.base import BaseCommand
+from rango.models import Category, CategoryLike
+from rango import leaderboard
+
+
+class Command(BaseCommand):
+    help = ("Recomputes Category.likes from the CategoryLike rows in a "
+            "single UPDATE.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many counts are off.")
+
+    def handle(self, *args, **options):
+        counted = CategoryLike.objects.filter(category=OuterRef('pk')) \
+                                      .values('category') \
+                                      .annotate(n=Count('id')) \
+                                      .values('n')
+        actual = Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+        wrong = Category.objects.annotate(actual=actual) \
+                                .exclude(likes=F('actual')).count()
+        if options['dry_run']:
+            self.stdout.write("%d categories have the wrong like count." %
+                              wrong)
+            return
+        if wrong:
+            Category.objects.update(likes=actual)
+            leaderboard.categories.invalidate()
+            leaderboard.request_rebuild()
+        self.stdout.write("Fixed the like count of %d categories." % wrong)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rango import db
+
+
+class Command(BaseCommand):
+    help = ("Copies the primary SQLite database onto the replica file with "
+            "SQLite's online backup, standing in for replication when the "
+            "replica is a second local file.")
+
+    def handle(self, *args, **options):
+        alias = db.replica()
+        if not alias:
+            raise CommandError("No replica configured, set RANGO_DB_REPLICA_NAME.")
+        primary, replica = connections['default'], connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError("sync_replica only copies SQLite databases.")
+        #The replica connection is query_only, so write through a fresh one.
+        replica.close()
+        primary.ensure_connection()
+        target = replica.get_new_connection(replica.get_connection_params())
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        self.stdout.write("Copied %s to %s." % (
+            primary.settings_dict['NAME'], replica.settings_dict['NAME']))
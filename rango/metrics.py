@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+In-process histograms for request metrics, exposed in the Prometheus text
+format by the metrics view.
+"""
+
+import bisect
+import threading
+
+from django.conf import settings
+
+DURATION_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = [
+    ('rango_request_duration_ms', "Wall time spent in the view.",
+     DURATION_BUCKETS),
+    ('rango_db_queries', "Database queries run per request.", COUNT_BUCKETS),
+    ('rango_db_duration_ms', "Time spent in database queries per request.",
+     DURATION_BUCKETS),
+    ('rango_template_duration_ms', "Time spent rendering templates per "
+     "request.", DURATION_BUCKETS),
+]
+
+def is_enabled():
+    return getattr(settings, 'RANGO_METRICS_ENABLED', False)
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        #One count per bucket plus one for +Inf.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+_lock = threading.Lock()
+_histograms = {}
+_buckets = dict((name, buckets) for name, help, buckets in METRICS)
+
+def observe(metric, view, value):
+    key = (metric, view)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(_buckets[metric])
+        histogram.observe(value)
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+def render_text():
+    lines = []
+    with _lock:
+        for name, help, buckets in METRICS:
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s histogram' % name)
+            for (metric, view), histogram in sorted(_histograms.items()):
+                if metric != name:
+                    continue
+                view = _label(view)
+                total = 0
+                for bound, count in zip(buckets + ('+Inf',),
+                                        histogram.counts):
+                    total += count
+                    lines.append('%s_bucket{view="%s",le="%s"} %d' %
+                                 (name, view, bound, total))
+                lines.append('%s_sum{view="%s"} %s' % (name, view,
+                                                       histogram.sum))
+                lines.append('%s_count{view="%s"} %d' % (name, view,
+                                                         histogram.count))
+    return '\n'.join(lines) + '\n'
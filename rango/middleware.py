@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Middleware for rango.
+"""
+
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rango import instrumentation, metrics, queryprofile
+
+class RequestMetricsMiddleware(object):
+    #Times each request, its database queries and its template rendering.
+    #The numbers are sent back in a Server-Timing header and added to the
+    #histograms served by the metrics view. Raises MiddlewareNotUsed when
+    #RANGO_METRICS_ENABLED is off, so it then costs nothing at all.
+    def __init__(self, get_response):
+        if not metrics.is_enabled():
+            raise MiddlewareNotUsed
+        instrumentation.install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = {'queries': 0, 'db': 0.0, 'templates': 0.0}
+
+        def on_query(connection, sql, params, seconds):
+            timing['queries'] += 1
+            timing['db'] += seconds
+
+        def on_template(name, seconds, depth):
+            if depth == 0:
+                timing['templates'] += seconds
+
+        with instrumentation.listen(on_query, on_template):
+            start = perf_counter()
+            response = self.get_response(request)
+            total = (perf_counter() - start) * 1000
+
+        db = timing['db'] * 1000
+        templates = timing['templates'] * 1000
+        response['Server-Timing'] = (
+            'total;dur=%.2f, db;dur=%.2f;desc="%d queries", tpl;dur=%.2f' %
+            (total, db, timing['queries'], templates))
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unmatched'
+        metrics.observe('rango_request_duration_ms', view, total)
+        metrics.observe('rango_db_queries', view, timing['queries'])
+        metrics.observe('rango_db_duration_ms', view, db)
+        metrics.observe('rango_template_duration_ms', view, templates)
+        return response
+
+
+class QueryProfilerMiddleware(object):
+    #Debug aid: logs the N+1 candidates, repeated queries and full table
+    #scans of each request, see rango.queryprofile. Only there when DEBUG
+    #and RANGO_QUERY_PROFILE are both on; RANGO_QUERY_PROFILE_HEADER adds
+    #the summary to the response as X-Query-Profile.
+    def __init__(self, get_response):
+        if not (settings.DEBUG and getattr(settings, 'RANGO_QUERY_PROFILE', False)):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with queryprofile.capture() as profile:
+            response = self.get_response(request)
+        summary = profile.log('%s %s' % (request.method, request.path))
+        if getattr(settings, 'RANGO_QUERY_PROFILE_HEADER', False):
+            response['X-Query-Profile'] = summary
+        return response
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from rango import search
+    search.rebuild_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from rango import search
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0004_auto_20190206_2254'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
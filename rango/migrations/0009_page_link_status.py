@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 18:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0008_categorylike'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='link_checked_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='link_latency_ms',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='link_status',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
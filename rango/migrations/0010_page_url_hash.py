@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 18:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def backfill_url_hashes(apps, schema_editor):
+    from rango import urlnorm
+    Page = apps.get_model('rango', 'Page')
+    pages = Page.objects.using(schema_editor.connection.alias)
+    last = 0
+    while True:
+        batch = list(pages.filter(id__gt=last).order_by('id')
+                          .values_list('id', 'url')[:1000])
+        if not batch:
+            break
+        for id, url in batch:
+            pages.filter(id=id).update(url_hash=urlnorm.url_hash(url))
+        last = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0009_page_link_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='url_hash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_url_hashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['category', 'url_hash'], name='rango_page_category_url'),
+        ),
+    ]
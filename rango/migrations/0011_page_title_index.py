@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 18:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0010_page_url_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='page',
+            name='title',
+            field=models.CharField(db_index=True, max_length=128),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 18:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0011_page_title_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageViewBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.IntegerField(db_index=True)),
+                ('views', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rango.Category')),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rango.Page')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='pageviewbucket',
+            unique_together=set([('page', 'hour')]),
+        ),
+    ]
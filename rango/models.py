@@ -1,13 +1,16 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.template.defaultfilters import slugify
 from django.contrib.auth.models import User
+from rango import urlnorm
 
 # Create your models here.
 
 class Category(models.Model):
     name = models.CharField(max_length=128, unique=True)
     views = models.IntegerField(default = 0)
-    likes = models.IntegerField(default = 0)
+    #Indexed so the leaderboard can read the top categories off the index.
+    likes = models.IntegerField(default = 0, db_index=True)
     slug = models.SlugField(unique = True)
     
     def save(self, *args, **kwargs):
@@ -24,13 +27,86 @@ class Category(models.Model):
     
 class Page(models.Model):
     category = models.ForeignKey(Category)
-    title = models.CharField(max_length=128)
+    #Indexed for the admin's prefix search.
+    title = models.CharField(max_length=128, db_index=True)
     url = models.URLField()
-    views = models.IntegerField(default=0)
+    #Indexed for the leaderboard's most viewed pages, like Category.likes.
+    views = models.IntegerField(default=0, db_index=True)
+    #Filled in by the check_links command. link_status is the HTTP status of
+    #the last check, or 0 if the server could not be reached at all.
+    link_status = models.IntegerField(null=True, blank=True, editable=False)
+    link_latency_ms = models.IntegerField(null=True, blank=True, editable=False)
+    link_checked_at = models.DateTimeField(null=True, blank=True,
+                                           editable=False, db_index=True)
+    #rango.urlnorm.url_hash(url), kept up to date by save() and the catalog
+    #import. Two pages in a category with the same hash are duplicates.
+    url_hash = models.BigIntegerField(null=True, blank=True, editable=False)
+    
+    class Meta:
+        #Serves show_category's keyset pagination, which lists a category's
+        #pages by views and then id.
+        indexes = [
+            models.Index(fields=['category', 'views', 'id'],
+                         name='rango_page_category_views'),
+            models.Index(fields=['category', 'url_hash'],
+                         name='rango_page_category_url'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.url_hash = urlnorm.url_hash(self.url)
+        super(Page, self).save(*args, **kwargs)
+    
+    def validate_unique(self, exclude=None):
+        #Used by PageForm and the admin. A category holds each url once,
+        #checked with a single probe of the (category, url_hash) index.
+        super(Page, self).validate_unique(exclude=exclude)
+        if self.category_id is None or not self.url or 'url' in (exclude or ()):
+            return
+        duplicates = Page.objects.filter(category_id=self.category_id,
+                                         url_hash=urlnorm.url_hash(self.url))
+        if self.pk is not None:
+            duplicates = duplicates.exclude(pk=self.pk)
+        if duplicates.exists():
+            raise ValidationError({'url': "This page is already in the category."})
+    
+    @property
+    def link_dead(self):
+        return is_dead(self.link_status)
     
     def __str__(self):
         return self.title
     
+def is_dead(link_status):
+    #Unchecked links get the benefit of the doubt, redirects count as alive.
+    return link_status is not None and (link_status == 0 or link_status >= 400)
+    
+class PageViewBucket(models.Model):
+    #A page's views during one hour, counting hours from the epoch. Written
+    #by rango.counters, summed into trending scores and pruned once older
+    #than RANGO_TRENDING_WINDOW by rango.trending.
+    page = models.ForeignKey(Page)
+    category = models.ForeignKey(Category)
+    hour = models.IntegerField(db_index=True)
+    views = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('page', 'hour')
+    
+    def __str__(self):
+        return '%s at hour %d' % (self.page_id, self.hour)
+    
+class CategoryLike(models.Model):
+    #One row per user per liked category. Category.likes is the count of
+    #these, kept up to date by rango.likes.
+    user = models.ForeignKey(User)
+    category = models.ForeignKey(Category)
+    
+    class Meta:
+        unique_together = ('user', 'category')
+    
+    def __str__(self):
+        return '%s likes %s' % (self.user_id, self.category_id)
+    
 class UserProfile(models.Model):
      #This line is required. Links UserProfile to a User model instance.
      user = models.OneToOneField(User)
@@ -38,6 +114,8 @@ class UserProfile(models.Model):
      #The additional attributes we wish to include.
      website = models.URLField(blank=True)
      picture = models.ImageField(upload_to='profile_images', blank=True)
+     #Set once rango.thumbnails has made the small versions of the picture.
+     has_thumbnails = models.BooleanField(default=False, editable=False)
      
      #Override the __unicode__() method to return out something meaningful!
      def __str__(self):
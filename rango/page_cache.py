@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Full-page cache for anonymous GET requests.
+
+Responses are stored under their path and query string together with the
+tags of the data they were built from, e.g. 'categories' for the sidebar
+or 'category:3' for the pages of one category. Every tag has a version
+number in the cache. invalidate() bumps a version, and any entry stored
+under an older version is treated as missing, so a write only evicts the
+pages that showed the data it changed. Served pages carry a strong ETag
+and a matching If-None-Match gets a 304 without rendering anything.
+
+View counters are written in the background without invalidating
+anything, so rankings on cached pages can lag by up to
+RANGO_PAGE_CACHE_TIMEOUT seconds.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+TAG_KEY = 'rango:page_cache:tag:{0}'
+ENTRY_KEY = 'rango:page_cache:entry:{0}'
+
+def _timeout():
+    return getattr(settings, 'RANGO_PAGE_CACHE_TIMEOUT', 300)
+
+def tag_versions(tags):
+    keys = dict((TAG_KEY.format(tag), tag) for tag in tags)
+    found = cache.get_many(keys.keys())
+    versions = {}
+    for key, tag in keys.items():
+        if key not in found:
+            #Seed from the clock so a tag that was evicted never comes back
+            #with a version an old entry was stored under.
+            cache.add(key, int(time.time() * 1000), None)
+            found[key] = cache.get(key, 0)
+        versions[tag] = found[key]
+    return versions
+
+def invalidate(*tags):
+    for tag in tags:
+        try:
+            cache.incr(TAG_KEY.format(tag))
+        except ValueError:
+            #Nothing was ever cached under this tag's current version.
+            pass
+
+def tag_response(response, *tags):
+    #Records which data a response was built from.
+    response.cache_tags = getattr(response, 'cache_tags', ()) + tags
+    return response
+
+def content_etag(content):
+    return '"%s"' % hashlib.sha1(content).hexdigest()
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    return bool(header) and (etag in parse_etags(header) or
+                             header.strip() == '*')
+
+def _respond(request, entry):
+    if etag_matches(request, entry['etag']):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry['content'],
+                                content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+def _key(request, suffix):
+    raw = '%s|%s' % (request.get_full_path(), suffix)
+    return ENTRY_KEY.format(hashlib.md5(raw.encode('utf-8')).hexdigest())
+
+def cache_anonymous_page(prepare=None, on_hit=None):
+    #Decorator for views whose output only depends on the url and on data
+    #named by the tags the view attaches with tag_response().
+    #prepare(request) runs on every request, cached or not, and returns a
+    #string for anything else the page shows (e.g. a visit count).
+    #on_hit(request, tags, *args, **kwargs) runs when the cache answers.
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or
+                    request.user.is_authenticated or
+                    not getattr(settings, 'RANGO_PAGE_CACHE_ENABLED', True)):
+                return view(request, *args, **kwargs)
+
+            suffix = prepare(request) if prepare else ''
+            key = _key(request, suffix)
+            entry = cache.get(key)
+            if entry is not None and \
+                    tag_versions(entry['tags']) == entry['tags']:
+                if on_hit:
+                    on_hit(request, entry['tags'], *args, **kwargs)
+                return _respond(request, entry)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or \
+                    response.cookies:
+                return response
+            tags = getattr(response, 'cache_tags', ())
+            entry = {'content': response.content,
+                     'content_type': response['Content-Type'],
+                     'etag': content_etag(response.content),
+                     'tags': tag_versions(tags)}
+            cache.set(key, entry, _timeout())
+            return _respond(request, entry)
+        return wrapped
+    return decorator
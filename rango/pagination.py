@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Keyset (seek) pagination.
+
+Instead of OFFSET, which makes the database walk past every skipped row,
+each page is fetched with a WHERE clause that starts right after (or
+before) the last row the client saw. With an index that matches the
+ordering, page 10,000 costs the same as page one. The position is handed
+to clients as an opaque cursor string built from the ordering fields.
+
+EstimatedCountPaginator is for the admin, whose numbered pages need a total:
+it estimates instead of running COUNT(*) over the whole table.
+"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+class KeysetPage(object):
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+def _fields(ordering):
+    return [(key.lstrip('-'), key.startswith('-')) for key in ordering]
+
+def _value(item, field):
+    if isinstance(item, dict):
+        return item[field]
+    return getattr(item, field)
+
+def encode_cursor(item, ordering):
+    return '.'.join(str(_value(item, field)) for field, desc in
+                    _fields(ordering))
+
+def decode_cursor(cursor, ordering):
+    #Cursors are made of integer keys. Anything that doesn't parse is
+    #treated as no cursor at all, which means the first page.
+    if not cursor:
+        return None
+    parts = cursor.split('.')
+    if len(parts) != len(ordering):
+        return None
+    try:
+        return [int(part) for part in parts]
+    except ValueError:
+        return None
+
+def _seek(fields, values, forward):
+    #Builds "comes after values in the given order" (or before it when
+    #forward is False) for a multi-column ordering, e.g. for -views, -id:
+    #views <= v AND (views < v OR (views = v AND id < i)).
+    #The redundant bound on the first column lets the database seek into
+    #the index instead of filtering every row from the start.
+    condition = Q()
+    equal = {}
+    for (field, desc), value in zip(fields, values):
+        op = 'lt' if desc == forward else 'gt'
+        condition |= Q(**dict(equal, **{field + '__' + op: value}))
+        equal[field] = value
+    first, desc = fields[0]
+    bound = 'lte' if desc == forward else 'gte'
+    return Q(**{first + '__' + bound: values[0]}) & condition
+
+def seek(queryset, ordering, after=None):
+    #The queryset in the given order, starting after the decoded cursor
+    #values. For callers that want to stream rows rather than build a page.
+    if after is not None:
+        queryset = queryset.filter(_seek(_fields(ordering), after, True))
+    return queryset.order_by(*ordering)
+
+def paginate(queryset, ordering, size, after=None, before=None):
+    #ordering is a sequence like ('-views', '-id') whose last field must be
+    #unique. Pass the cursor from the previous page as after (next page) or
+    #before (previous page).
+    fields = _fields(ordering)
+    after = decode_cursor(after, ordering)
+    before = decode_cursor(before, ordering) if after is None else None
+
+    if before is not None:
+        reverse = [('' if desc else '-') + field for field, desc in fields]
+        rows = list(queryset.filter(_seek(fields, before, False))
+                            .order_by(*reverse)[:size + 1])
+        more = len(rows) > size
+        items = rows[:size][::-1]
+        previous_cursor = more and items and encode_cursor(items[0], ordering)
+        next_cursor = items and encode_cursor(items[-1], ordering)
+    else:
+        rows = list(seek(queryset, ordering, after)[:size + 1])
+        more = len(rows) > size
+        items = rows[:size]
+        next_cursor = more and encode_cursor(items[-1], ordering)
+        previous_cursor = (after is not None and items and
+                           encode_cursor(items[0], ordering))
+    return KeysetPage(items, next_cursor or None, previous_cursor or None)
+
+def _estimated_rows(queryset):
+    #A cheap guess at how many rows a table holds: the planner statistics
+    #on PostgreSQL, else the highest primary key, one index lookup.
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return int(row[0]) if row else None
+    return queryset.aggregate(top=Max('pk'))['top'] or 0
+
+class EstimatedCountPaginator(Paginator):
+    #Counts without reading the whole table. Unfiltered lists use an
+    #estimate of the table size, filtered ones (searches) stop counting at
+    #COUNT_LIMIT rows, so only the first COUNT_LIMIT matches are paged.
+    #Small tables are counted exactly.
+    COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = _estimated_rows(queryset)
+            if estimate is not None and estimate > self.COUNT_LIMIT:
+                return estimate
+        return queryset[:self.COUNT_LIMIT].count()
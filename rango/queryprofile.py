@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Query shape profiling for spotting N+1 queries and full table scans.
+
+capture() records every query the current thread runs inside the block,
+with its time and the innermost frame of project code that ran it. The
+QueryProfile it yields then groups the queries by shape, the SQL with every
+literal and placeholder replaced and IN lists collapsed, so a query run once
+per row of a loop shows up as one shape with a high count: an N+1
+candidate. The same SQL with the same parameters run twice is reported as
+a duplicate. The slowest SELECTs are run again under EXPLAIN QUERY PLAN and
+any step that reads a whole table is flagged.
+
+QueryProfilerMiddleware does this for every request when DEBUG and
+RANGO_QUERY_PROFILE are on, logging to the rango.queryprofile logger and, with
+RANGO_QUERY_PROFILE_HEADER, summing up in an X-Query-Profile header.
+"""
+
+import logging
+import os
+import re
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from rango import instrumentation
+
+logger = logging.getLogger(__name__)
+
+#Frames in these files are the profiler's own, not the caller.
+_OWN_FILES = tuple(os.path.join(os.path.dirname(__file__), name) for name in
+                   ('instrumentation.py', 'queryprofile.py', 'middleware.py'))
+
+_string = re.compile(r"'(?:[^']|'')*'")
+_number = re.compile(r'\b\d+(?:\.\d+)?\b')
+_placeholder = re.compile(r'%s|\?')
+_in_list = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_space = re.compile(r'\s+')
+#"SCAN rango_page" from SQLite 3.36 on, "SCAN TABLE rango_page" before,
+#either with "AS alias" or a covering index it reads from end to end.
+_full_scan = re.compile(r'^SCAN (?:TABLE )?(?!CONSTANT ROW)(?!SUBQUERY )(?!\()'
+                        r'(\S+)(?: AS \S+)?(?: USING COVERING INDEX \S+)?$')
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+def shape(sql):
+    #The SQL with its values taken out, the same for every run of a query
+    #whatever its parameters.
+    sql = _string.sub('?', sql)
+    sql = _number.sub('?', sql)
+    sql = _placeholder.sub('?', sql)
+    sql = _in_list.sub('(...)', sql)
+    return _space.sub(' ', sql).strip()
+
+def full_scans(plan):
+    #The tables an EXPLAIN QUERY PLAN reads in full.
+    return [match.group(1) for match in map(_full_scan.match, plan) if match]
+
+def _project_root():
+    return os.path.abspath(getattr(settings, 'BASE_DIR', os.getcwd()))
+
+def _caller(root):
+    #The innermost frame in the project's own code, as "path:line in name".
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(root) and not filename.startswith(_OWN_FILES)
+                and os.sep + 'site-packages' + os.sep not in filename):
+            return '%s:%d in %s' % (os.path.relpath(filename, root),
+                                    frame.f_lineno, frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+class Query(object):
+    def __init__(self, connection, sql, params, seconds, caller):
+        self.connection = connection
+        self.sql = sql
+        self.params = params
+        self.seconds = seconds
+        self.caller = caller
+        self.shape = shape(sql)
+        self.plan = None
+        self.scans = []
+
+
+class QueryProfile(object):
+    def __init__(self):
+        self.queries = []
+
+    @property
+    def seconds(self):
+        return sum(query.seconds for query in self.queries)
+
+    def groups(self):
+        #shape -> queries, in the order the shapes first ran.
+        groups = OrderedDict()
+        for query in self.queries:
+            groups.setdefault(query.shape, []).append(query)
+        return groups
+
+    def repeated(self, threshold=None):
+        #N+1 candidates: (shape, queries) run at least threshold times from
+        #the same line of code.
+        if threshold is None:
+            threshold = _setting('RANGO_QUERY_PROFILE_REPEAT', 3)
+        found = []
+        for sql, queries in self.groups().items():
+            callers = {}
+            for query in queries:
+                callers.setdefault(query.caller, []).append(query)
+            for caller, same in callers.items():
+                if len(same) >= threshold:
+                    found.append((sql, same))
+        return found
+
+    def duplicates(self):
+        #Identical SQL and parameters run more than once.
+        seen = OrderedDict()
+        for query in self.queries:
+            key = (query.connection.alias, query.sql, repr(query.params))
+            seen.setdefault(key, []).append(query)
+        return [queries for queries in seen.values() if len(queries) > 1]
+
+    def slowest(self, n=None):
+        if n is None:
+            n = _setting('RANGO_QUERY_PROFILE_EXPLAIN', 3)
+        return sorted(self.queries, key=lambda query: -query.seconds)[:n]
+
+    def explain(self, n=None):
+        #Runs EXPLAIN QUERY PLAN for the n slowest SELECTs (SQLite only) and
+        #returns the ones that scan a whole table.
+        scanning = []
+        for query in self.slowest(n):
+            if (query.connection.vendor != 'sqlite' or
+                    not query.sql.lstrip().upper().startswith('SELECT')):
+                continue
+            with query.connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query.sql, query.params)
+                query.plan = [row[-1] for row in cursor.fetchall()]
+            query.scans = full_scans(query.plan)
+            if query.scans:
+                scanning.append(query)
+        return scanning
+
+    def summary(self, repeated, scanning):
+        parts = ['%d queries' % len(self.queries),
+                 '%.1fms' % (self.seconds * 1000)]
+        for sql, queries in repeated:
+            parts.append('n+1=%dx %s' % (len(queries), queries[0].caller))
+        for query in scanning:
+            parts.append('scan=%s %s' % (','.join(query.scans), query.caller))
+        return '; '.join(parts)
+
+    def log(self, label):
+        #Logs the findings and returns a one line summary of them.
+        repeated = self.repeated()
+        scanning = self.explain()
+        for sql, queries in repeated:
+            logger.warning("%s: possible N+1, %d queries from %s: %s",
+                           label, len(queries), queries[0].caller, sql)
+        for queries in self.duplicates():
+            logger.info("%s: the same query ran %d times from %s: %s",
+                        label, len(queries), queries[0].caller, queries[0].sql)
+        for query in scanning:
+            logger.warning("%s: full scan of %s in a %.1fms query from %s: "
+                           "%s\n    %s", label, ', '.join(query.scans),
+                           query.seconds * 1000, query.caller, query.sql,
+                           '\n    '.join(query.plan))
+        summary = self.summary(repeated, scanning)
+        logger.debug("%s: %s", label, summary)
+        return summary
+
+
+@contextmanager
+def capture():
+    #Profiles the queries this thread runs inside the block.
+    profile = QueryProfile()
+    root = _project_root()
+
+    def on_query(connection, sql, params, seconds):
+        profile.queries.append(Query(connection, sql, params, seconds, _caller(root)))
+
+    with instrumentation.listen(queries=on_query):
+        yield profile
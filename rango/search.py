@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Full-text search over pages and categories.
+
+Backed by two SQLite FTS5 tables that use rango_page and rango_category as
+external content, so the text isn't stored twice. Triggers on the content
+tables keep the indexes in step with every insert, update and delete,
+including bulk_create() and raw SQL that never send model signals. Other
+database backends have no index and every search comes back empty.
+"""
+
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+
+#FTS table, content table, indexed columns.
+INDEXES = [
+    ('rango_page_fts', 'rango_page', ('title', 'url')),
+    ('rango_category_fts', 'rango_category', ('name',)),
+]
+
+#Don't let a single query turn into an enormous MATCH expression.
+MAX_TERMS = 8
+MAX_PAGE = 50
+
+SearchResults = namedtuple('SearchResults',
+                           'query pages categories page has_next')
+
+def is_supported(conn=None):
+    return (conn or connection).vendor == 'sqlite'
+
+def _index_sql(fts, table, columns):
+    cols = ', '.join(columns)
+    new = ', '.join('new.' + c for c in columns)
+    old = ', '.join('old.' + c for c in columns)
+    delete = ("INSERT INTO {fts}({fts}, rowid, {cols}) "
+              "VALUES ('delete', old.id, {old});")
+    insert = "INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});"
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, "
+        "content='{table}', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} "
+        "BEGIN " + insert + " END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} "
+        "BEGIN " + delete + " END",
+        #Only the indexed columns, so counter updates leave the index alone.
+        "CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} "
+        "ON {table} BEGIN " + delete + " " + insert + " END",
+    ]
+    return [s.format(fts=fts, table=table, cols=cols, new=new, old=old)
+            for s in statements]
+
+def create_index(conn=None):
+    #Creates any missing FTS table or trigger. Safe to run repeatedly.
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        for fts, table, columns in INDEXES:
+            for statement in _index_sql(fts, table, columns):
+                cursor.execute(statement)
+
+def repair_triggers(conn=None):
+    #Puts back triggers lost when Django rebuilt a content table during a
+    #migration. Does nothing if the search tables haven't been created.
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        for fts, table, columns in INDEXES:
+            cursor.execute("SELECT 1 FROM sqlite_master "
+                           "WHERE type = 'table' AND name = %s", [fts])
+            if cursor.fetchone() is None:
+                continue
+            for statement in _index_sql(fts, table, columns)[1:]:
+                cursor.execute(statement)
+
+def rebuild_index(conn=None):
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    create_index(conn)
+    with conn.cursor() as cursor:
+        for fts, table, columns in INDEXES:
+            cursor.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(fts))
+            cursor.execute("INSERT INTO {0}({0}) VALUES ('optimize')".format(fts))
+
+def drop_index(conn=None):
+    conn = conn or connection
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        for fts, table, columns in INDEXES:
+            for suffix in ('_ai', '_ad', '_au'):
+                cursor.execute("DROP TRIGGER IF EXISTS " + fts + suffix)
+            cursor.execute("DROP TABLE IF EXISTS " + fts)
+
+def build_match(query):
+    #Turns free text into an FTS5 expression: every word must match, as a
+    #prefix, so "djan tut" finds "Django Tutorial". Quoting each word keeps
+    #FTS5 operators in user input from being interpreted.
+    terms = re.findall(r'\w+', query, re.UNICODE)[:MAX_TERMS]
+    return ' '.join('"%s"*' % term for term in terms)
+
+def _page_size():
+    return getattr(settings, 'RANGO_SEARCH_PAGE_SIZE', 20)
+
+def search(query, page=1):
+    page = max(1, min(page, MAX_PAGE))
+    match = build_match(query)
+    if not match or not is_supported():
+        return SearchResults(query, [], [], page, False)
+
+    size = _page_size()
+    with connection.cursor() as cursor:
+        #bm25() weighs a hit in the title ten times one in the url. We ask
+        #for one row more than we show to know whether there's a next page.
+        cursor.execute(
+            "SELECT p.id, p.title, p.url, c.name, c.slug "
+            "FROM rango_page_fts "
+            "JOIN rango_page p ON p.id = rango_page_fts.rowid "
+            "JOIN rango_category c ON c.id = p.category_id "
+            "WHERE rango_page_fts MATCH %s "
+            "ORDER BY bm25(rango_page_fts, 10.0, 1.0) "
+            "LIMIT %s OFFSET %s", [match, size + 1, (page - 1) * size])
+        pages = [{'id': row[0], 'title': row[1], 'url': row[2],
+                  'category': {'name': row[3], 'slug': row[4]}}
+                 for row in cursor.fetchall()]
+        categories = []
+        if page == 1:
+            cursor.execute(
+                "SELECT c.id, c.name, c.slug "
+                "FROM rango_category_fts "
+                "JOIN rango_category c ON c.id = rango_category_fts.rowid "
+                "WHERE rango_category_fts MATCH %s "
+                "ORDER BY rank LIMIT %s", [match, size])
+            categories = [{'id': row[0], 'name': row[1], 'slug': row[2]}
+                          for row in cursor.fetchall()]
+    return SearchResults(query, pages[:size], categories, page,
+                         len(pages) > size)
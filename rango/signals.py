@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Model signal receivers for rango. Connected in RangoConfig.ready().
+"""
+
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from rango.models import Category, Page
+from rango import (category_cache, db, leaderboard, page_cache, search,
+                   usernames)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, **kwargs):
+    #Not before the commit, or a request could cache the old list again
+    #under the new version.
+    transaction.on_commit(category_cache.invalidate)
+
+def _invalidate_pages_on_commit(*tags):
+    #Like the category list, only once the write is visible to the request
+    #that renders the page again.
+    transaction.on_commit(lambda: page_cache.invalidate(*tags))
+
+#Every page shows the sidebar, so any category write evicts every cached
+#page. A page write only evicts its category and the index.
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    _invalidate_pages_on_commit('categories', 'category:%d' % instance.id)
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def invalidate_page_pages(sender, instance, **kwargs):
+    _invalidate_pages_on_commit('pages', 'category:%d' % instance.category_id)
+
+@receiver(post_save, sender=Category)
+def update_category_leaderboard(sender, instance, **kwargs):
+    leaderboard.category_changed(instance)
+
+@receiver(post_delete, sender=Category)
+def remove_from_category_leaderboard(sender, instance, **kwargs):
+    leaderboard.categories.remove(instance.id)
+
+@receiver(post_save, sender=Page)
+def update_page_leaderboard(sender, instance, **kwargs):
+    leaderboard.page_changed(instance)
+
+@receiver(post_delete, sender=Page)
+def remove_from_page_leaderboard(sender, instance, **kwargs):
+    leaderboard.pages.remove(instance.id)
+
+@receiver(post_migrate)
+def repair_search_triggers(sender, using, **kwargs):
+    #SQLite drops a table's triggers when a migration rebuilds it to add or
+    #alter a column, which would silently stop the search index updating.
+    if sender.name == 'rango':
+        search.repair_triggers(connections[using])
+
+@receiver(post_save, sender=User)
+def add_username(sender, instance, created, update_fields=None, **kwargs):
+    #New users and saves that may rename one; the old name just stays in
+    #the filter. A login only saves last_login.
+    if created or update_fields is None or 'username' in update_fields:
+        usernames.added(instance.username)
+
+@receiver(post_delete, sender=User)
+def remove_username(sender, instance, **kwargs):
+    usernames.deleted(instance.username)
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    db.configure_connection(connection)
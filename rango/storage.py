@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Static and media delivery.
+
+collectstatic with CompressedManifestStaticFilesStorage writes every file
+under a content-hashed name (mascot.3f2a9c.jpg) plus a staticfiles.json
+manifest, so {% static %} always points at a name that changes whenever the
+content does. Text assets additionally get .gz (and, when the optional
+brotli package is installed, .br) siblings compressed once at build time,
+so the front-end server never compresses on the fly.
+
+Because hashed names never change content, the front-end server can cache
+them forever. For nginx:
+
+    location /static/ {
+        alias /srv/rango/static_root/;
+        gzip_static on;
+        brotli_static on;   #needs ngx_brotli
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
+    location /protected-media/ {
+        internal;
+        alias /srv/rango/media/;
+    }
+
+Media uploads are not hashed, so serve_media hands them to the front-end
+server with X-Accel-Redirect (nginx) or X-Sendfile (Apache mod_xsendfile,
+lighttpd) and a shorter RANGO_MEDIA_MAX_AGE; the Django worker only does a
+stat, never streams bytes.
+"""
+
+import gzip
+import io
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.http import urlquote
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#Formats that are already compressed (images, fonts) gain nothing
+COMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.xml',
+                       '.map', '.ico')
+
+#Files smaller than this fit in a packet either way
+COMPRESS_MIN_SIZE = 256
+
+def _gzip(data):
+    #A fixed mtime keeps the output identical between builds
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as handle:
+        handle.write(data)
+    return buffer.getvalue()
+
+def _encodings():
+    encodings = [('gz', _gzip)]
+    if brotli is not None:
+        encodings.append(('br', lambda data: brotli.compress(data)))
+    return encodings
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, *args, **kwargs):
+        #The manifest storage may yield a file once per pass; compress each
+        #final hashed file once, after the hashing and url rewriting.
+        compressed = set()
+        for name, hashed_name, processed in super(
+                CompressedManifestStaticFilesStorage, self).post_process(*args, **kwargs):
+            if (hashed_name and not isinstance(processed, Exception)
+                    and hashed_name not in compressed):
+                compressed.add(hashed_name)
+                self.compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def compress(self, name):
+        if not name.lower().endswith(COMPRESS_EXTENSIONS):
+            return []
+        with self.open(name) as handle:
+            data = handle.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return []
+        written = []
+        for suffix, encode in _encodings():
+            encoded = encode(data)
+            #Keep the variant only when it actually saves bytes
+            if len(encoded) >= len(data) * 0.95:
+                continue
+            target = '%s.%s' % (name, suffix)
+            if self.exists(target):
+                self.delete(target)
+            self._save(target, ContentFile(encoded))
+            written.append(target)
+        return written
+
+@require_safe
+def serve_media(request, path):
+    #Hand an uploaded file to the front-end server instead of streaming it
+    #through Django.
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    mode = settings.RANGO_MEDIA_SENDFILE
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'RANGO_MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + urlquote(path.lstrip('/'))
+    else:
+        response['X-Sendfile'] = full_path
+    response['Cache-Control'] = 'public, max-age=%d' % getattr(
+        settings, 'RANGO_MEDIA_MAX_AGE', 86400)
+    return response
@@ -6,14 +6,20 @@ Created on Wed Feb  6 21:46:11 2019
 """
 
 from django import template
-from rango.models import Category
+from rango import category_cache, thumbnails
 
 register = template.Library()
 
-@register.inclusion_tag('rango/cats.html')
+#The sidebar is rendered once per active category and then served from the
+#cache, so in the steady state it costs no database work at all.
+@register.simple_tag
 def get_category_list(cat=None):
-    return {'cats': Category.objects.all(),
-            'act_cat': cat}
+    return category_cache.render_sidebar(getattr(cat, 'id', None))
+
+#The url of a profile picture thumbnail at least size pixels wide.
+@register.simple_tag
+def avatar_url(profile, size=128):
+    return thumbnails.avatar_url(profile, size)
 
 
 
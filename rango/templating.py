@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Template warm-up and render profiling for the rango templates.
+
+With RANGO_TEMPLATE_CACHE on, settings.py puts Django's cached loader in
+front of the filesystem and app loaders, and RangoConfig.ready() calls
+warm() so every template under templates/rango (and the base.html chain
+and sidebar fragment they pull in) is compiled before the first request.
+
+profile() renders each template repeatedly with a representative context
+and reports the mean cost of every template, including the ones rendered
+from inside another (like the sidebar), and of every {% block %}.
+"""
+
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.template import loader
+from django.template.loader_tags import BlockNode
+from django.test import RequestFactory
+from rango.models import Category, Page
+from rango import instrumentation, leaderboard, pagination, search
+
+TEMPLATE_SUBDIR = 'rango'
+
+def template_names():
+    directory = os.path.join(settings.TEMPLATE_DIR, TEMPLATE_SUBDIR)
+    return sorted(TEMPLATE_SUBDIR + '/' + name
+                  for name in os.listdir(directory) if name.endswith('.html'))
+
+def warm():
+    #Loading a template through the cached loader compiles it and keeps
+    #it. base.html is loaded the same way when a child extends it.
+    for name in template_names():
+        loader.get_template(name)
+
+def sample_contexts():
+    #A context for each template that exercises what a real request would.
+    from rango.forms import (CategoryForm, PageForm, UserForm,
+                             UserProfileForm)
+    category = Category.objects.order_by('-likes').first()
+    pages = None
+    if category is not None:
+        pages = pagination.paginate(Page.objects.filter(category=category),
+                                    ('-views', '-id'),
+                                    settings.RANGO_CATEGORY_PAGE_SIZE)
+    return {
+        'rango/index.html': {'categories': leaderboard.top_categories(),
+                             'pages': leaderboard.top_pages()},
+        'rango/about.html': {'visits': 1},
+        'rango/category.html': {'category': category, 'pages': pages},
+        'rango/add_category.html': {'form': CategoryForm()},
+        'rango/add_page.html': {'form': PageForm(), 'category': category},
+        'rango/register.html': {'user_form': UserForm(),
+                                'profile_form': UserProfileForm()},
+        'rango/search.html': {'results': search.search(
+            category.name if category else 'rango')},
+    }
+
+@contextmanager
+def _timed_blocks(record):
+    original = BlockNode.render
+
+    def render(self, context):
+        start = perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            #The node doing the rendering belongs to the template that
+            #defines the block first (usually base.html), so name it after
+            #the page being rendered instead.
+            template = context.template.name if context.template else '?'
+            record('%s::%s' % (template, self.name), perf_counter() - start)
+
+    BlockNode.render = render
+    try:
+        yield
+    finally:
+        BlockNode.render = original
+
+def profile(iterations=20, names=None):
+    #Returns {'templates': {...}, 'blocks': {...}} with the mean
+    #milliseconds per render of the requested page templates. Times
+    #are inclusive of anything nested inside.
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+    request.session = {}
+    contexts = sample_contexts()
+    names = names or template_names()
+
+    totals = {'templates': defaultdict(float), 'blocks': defaultdict(float)}
+
+    def on_template(name, seconds, depth):
+        totals['templates'][name or '<string>'] += seconds
+
+    def on_block(name, seconds):
+        totals['blocks'][name] += seconds
+
+    with instrumentation.listen(templates=on_template), \
+            _timed_blocks(on_block):
+        for name in names:
+            context = contexts.get(name, {})
+            for i in range(iterations):
+                #Load every time, so an uncached loader's parsing shows up.
+                loader.get_template(name).render(context, request)
+
+    runs = float(iterations)
+    return dict((kind, dict((name, seconds * 1000 / runs)
+                            for name, seconds in values.items()))
+                for kind, values in totals.items())
@@ -1,3 +1,1366 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from importlib import import_module
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.core.signals import request_started
+from django.db import close_old_connections, connection, connections
+from django.http import Http404, HttpResponse
+from django.template import engines
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
+from PIL import Image
+from rango.models import (Category, CategoryLike, Page, PageViewBucket,
+                          UserProfile)
+from rango import (benchmark, catalog, category_cache, counters, db,
+                   leaderboard, likes, linkcheck, loadtest, metrics,
+                   page_cache, pagination, queryprofile, search, storage,
+                   templating, thumbnails, trending, urlnorm, usernames)
+from rango.forms import UserForm
+from rango.middleware import QueryProfilerMiddleware
+from rango.views import username_present, visitor_cookie_handler
+
+
+@contextmanager
+def committed():
+    #TestCase never commits, so run what transaction.on_commit() queued
+    #inside the block at the end of it, as a commit would.
+    callbacks = []
+    with patch('django.db.transaction.on_commit', callbacks.append):
+        yield
+    for callback in callbacks:
+        callback()
+
+
+class SidebarCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sidebar_is_served_from_cache(self):
+        python = Category.objects.create(name='Python')
+        category_cache.render_sidebar(python.id)
+        with self.assertNumQueries(0):
+            html = category_cache.render_sidebar(python.id)
+        self.assertIn('<strong>', html)
+        self.assertIn('/rango/category/python/', html)
+
+    def test_saving_a_category_invalidates_sidebar(self):
+        Category.objects.create(name='Python')
+        self.assertNotIn('Django', category_cache.render_sidebar())
+        with committed():
+            Category.objects.create(name='Django')
+        self.assertIn('Django', category_cache.render_sidebar())
+        with committed():
+            Category.objects.get(name='Django').delete()
+        self.assertNotIn('Django', category_cache.render_sidebar())
+
+    def test_invalidation_waits_for_the_commit(self):
+        version = category_cache.get_version()
+        with committed():
+            Category.objects.create(name='Python')
+            #Or another request could cache the uncommitted list under the
+            #new version.
+            self.assertEqual(category_cache.get_version(), version)
+        self.assertNotEqual(category_cache.get_version(), version)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        leaderboard.categories.invalidate()
+        leaderboard.pages.invalidate()
+
+    def test_top_categories_follow_likes(self):
+        for i in range(8):
+            Category.objects.create(name='Cat %d' % i, likes=i)
+        names = [c['name'] for c in leaderboard.top_categories()]
+        self.assertEqual(names, ['Cat 7', 'Cat 6', 'Cat 5', 'Cat 4', 'Cat 3'])
+
+        low = Category.objects.get(name='Cat 0')
+        low.likes = 100
+        low.save()
+        with self.assertNumQueries(0):
+            names = [c['name'] for c in leaderboard.top_categories()]
+        self.assertEqual(names[0], 'Cat 0')
+
+    def test_board_matches_database_after_drops(self):
+        with self.settings(RANGO_LEADERBOARD_SLACK=0):
+            cats = [Category.objects.create(name='Cat %d' % i, likes=i)
+                    for i in range(10)]
+            leaderboard.top_categories()
+            for cat in cats[5:]:
+                cat.likes = 0
+                cat.save()
+            expected = list(Category.objects.order_by('-likes', 'id')
+                            .values_list('name', flat=True)[:5])
+            names = [c['name'] for c in leaderboard.top_categories()]
+            self.assertEqual(names, expected)
+
+    def test_rebuilds_walk_an_index(self):
+        for queryset in (leaderboard._load_categories(25),
+                         leaderboard._load_pages(25)):
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+            self.assertIn('USING INDEX', plan[0])
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_index_uses_leaderboards(self):
+        python = Category.objects.create(name='Python', likes=3)
+        Page.objects.create(category=python, title='Docs',
+                            url='http://docs.python.org/', views=5)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Docs')
+        self.assertEqual(response.context['categories'][0]['name'], 'Python')
+
+
+@override_settings(RANGO_VIEW_FLUSH_INTERVAL=None)
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = Category.objects.create(name='Python')
+        self.docs = Page.objects.create(category=self.python, title='Docs',
+                                        url='http://docs.python.org/')
+
+    def tearDown(self):
+        counters.flush()
+
+    def test_goto_redirects_and_buffers_the_click(self):
+        for i in range(3):
+            response = self.client.get(reverse('goto', args=[self.docs.id]))
+            self.assertRedirects(response, 'http://docs.python.org/',
+                                 fetch_redirect_response=False)
+        self.docs.refresh_from_db()
+        self.assertEqual(self.docs.views, 0)
+        counters.flush()
+        self.docs.refresh_from_db()
+        self.assertEqual(self.docs.views, 3)
+
+    def test_goto_unknown_page_goes_to_index(self):
+        response = self.client.get(reverse('goto', args=[9999]))
+        self.assertRedirects(response, reverse('index'))
+
+    def test_flush_coalesces_increments(self):
+        other = Page.objects.create(category=self.python, title='Blog',
+                                    url='http://blog.python.org/')
+        self.client.get(reverse('show_category', args=['python']))
+        counters.record_page_view(self.docs.id, 2)
+        counters.record_page_view(other.id, 2)
+        #One UPDATE per distinct increment, three queries to add to this
+        #hour's trending buckets and one to refresh the leaderboard, then
+        #one UPDATE for the category. Each model is written in a
+        #transaction, here a savepoint and its release.
+        with self.assertNumQueries(10):
+            counters.flush()
+        self.python.refresh_from_db()
+        self.assertEqual(self.python.views, 1)
+        self.assertEqual(Page.objects.get(id=other.id).views, 2)
+
+    def test_full_buffer_is_flushed_straight_away(self):
+        with self.settings(RANGO_VIEW_BUFFER_SIZE=1):
+            counters.record_page_view(self.docs.id)
+        self.assertEqual(Page.objects.get(id=self.docs.id).views, 1)
+
+
+class VisitorTrackingTests(TestCase):
+    def make_request(self, session_key=None):
+        request = RequestFactory().get('/')
+        engine = import_module(settings.SESSION_ENGINE)
+        request.session = engine.SessionStore(session_key)
+        return request
+
+    def test_repeat_visit_does_not_modify_session(self):
+        request = self.make_request()
+        visitor_cookie_handler(request)
+        self.assertTrue(request.session.modified)
+        self.assertEqual(request.session['visits'], 1)
+        request.session.save()
+
+        request = self.make_request(request.session.session_key)
+        visitor_cookie_handler(request)
+        self.assertFalse(request.session.modified)
+
+    def test_visit_a_day_later_is_counted(self):
+        request = self.make_request()
+        yesterday = timezone.now() - timedelta(days=2)
+        request.session['last_visit'] = str(yesterday.replace(tzinfo=None))
+        request.session['visits'] = 4
+        visitor_cookie_handler(request)
+        self.assertEqual(request.session['visits'], 5)
+
+    def test_purge_sessions_removes_only_expired(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key='old%d' % i, session_data='',
+                                   expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='',
+                               expire_date=now + timedelta(days=1))
+        with self.settings(
+                SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            call_command('purge_sessions', batch_size=2, stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key',
+                                                          flat=True)),
+                         ['live'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        Page.objects.create(category=self.python, title='Official Tutorial',
+                            url='http://docs.python.org/2/tutorial/')
+        Page.objects.create(category=self.django, title='Django Rocks',
+                            url='http://www.djangorocks.com/')
+
+    def titles(self, query, page=1):
+        return [p['title'] for p in search.search(query, page).pages]
+
+    def test_matches_title_url_and_prefix(self):
+        self.assertEqual(self.titles('tutor'), ['Official Tutorial'])
+        self.assertEqual(self.titles('djangorocks'), ['Django Rocks'])
+        self.assertEqual(self.titles('tutorial rocks'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        page = Page.objects.get(title='Django Rocks')
+        page.title = 'Django Rules'
+        page.save()
+        self.assertEqual(self.titles('rocks'), [])
+        self.assertEqual(self.titles('rules'), ['Django Rules'])
+        page.delete()
+        self.assertEqual(self.titles('rules'), [])
+
+    def test_categories_and_json_endpoint(self):
+        response = self.client.get(reverse('search_json'), {'query': 'djang'})
+        data = response.json()
+        self.assertEqual([c['name'] for c in data['categories']], ['Django'])
+        self.assertEqual(data['pages'][0]['category']['slug'], 'django')
+
+    def test_pagination_and_operator_input(self):
+        for i in range(3):
+            Page.objects.create(category=self.python, title='Extra %d' % i,
+                                url='http://example.com/%d' % i)
+        with self.settings(RANGO_SEARCH_PAGE_SIZE=2):
+            first = search.search('extra')
+            second = search.search('extra', 2)
+        self.assertTrue(first.has_next)
+        self.assertFalse(second.has_next)
+        self.assertEqual(len(first.pages) + len(second.pages), 3)
+        self.assertEqual(self.titles('"OR * NEAR('), [])
+
+    def test_search_page_renders(self):
+        response = self.client.get(reverse('search'), {'query': 'python'})
+        self.assertContains(response, 'Official Tutorial')
+
+
+@override_settings(RANGO_VIEW_FLUSH_INTERVAL=None)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = Category.objects.create(name='Python')
+        #Plenty of ties on views so the id tie-break matters.
+        for i in range(25):
+            Page.objects.create(category=self.python, title='Page %d' % i,
+                                url='http://example.com/%d' % i,
+                                views=i // 3)
+        self.expected = list(Page.objects.order_by('-views', '-id')
+                             .values_list('id', flat=True))
+
+    def tearDown(self):
+        counters.flush()
+
+    def walk(self, size):
+        queryset = Page.objects.filter(category=self.python)
+        seen, cursor, pages = [], None, []
+        while True:
+            page = pagination.paginate(queryset, ('-views', '-id'), size,
+                                       after=cursor)
+            pages.append(page)
+            seen.extend(p.id for p in page)
+            if not page.has_next():
+                return seen, pages
+            cursor = page.next_cursor
+
+    def test_forward_walk_visits_every_page_once(self):
+        seen, pages = self.walk(4)
+        self.assertEqual(seen, self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+    def test_previous_cursor_returns_the_same_page(self):
+        seen, pages = self.walk(4)
+        back = pagination.paginate(Page.objects.filter(category=self.python),
+                                   ('-views', '-id'), 4,
+                                   before=pages[2].previous_cursor)
+        self.assertEqual([p.id for p in back], [p.id for p in pages[1]])
+        self.assertEqual(back.next_cursor, pages[1].next_cursor)
+
+    def test_show_category_links_between_pages(self):
+        with self.settings(RANGO_CATEGORY_PAGE_SIZE=10):
+            response = self.client.get(reverse('show_category',
+                                               args=['python']))
+            cursor = response.context['pages'].next_cursor
+            self.assertContains(response, '?after=%s' % cursor)
+            response = self.client.get(reverse('show_category',
+                                               args=['python']),
+                                       {'after': cursor})
+        self.assertEqual([p.id for p in response.context['pages']],
+                         self.expected[10:20])
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_reimport_skips_existing_pages(self):
+        lines = [
+            '{"category": "Python", "title": "Tutorial", "url": "http://a/"}',
+            '{"category": "Python", "title": "Tutorial", "url": "http://a/"}',
+            '{"category": "Django", "title": "Tutorial", "url": "http://a/"}',
+        ]
+        stats = catalog.import_records(catalog.read_records(lines))
+        self.assertEqual(stats.pages, 2)
+        stats = catalog.import_records(catalog.read_records(lines))
+        self.assertEqual(stats.pages, 0)
+        self.assertEqual(Page.objects.count(), 2)
+
+    def test_jsonl_import_upserts_categories_by_slug(self):
+        Category.objects.create(name='Python', likes=1)
+        lines = [
+            '{"type": "category", "name": "Python", "views": 128, "likes": 64}',
+            '{"category": "Python", "title": "Tutorial", "url": "http://a/"}',
+            '{"category": "Django", "title": "Rocks", "url": "http://b/", '
+            '"views": 13}',
+            '',
+        ]
+        stats = catalog.import_records(catalog.read_records(lines),
+                                       batch_size=2)
+        self.assertEqual((stats.rows, stats.categories, stats.pages),
+                         (3, 1, 2))
+        python = Category.objects.get(slug='python')
+        self.assertEqual((python.views, python.likes), (128, 64))
+        self.assertEqual(Page.objects.get(title='Rocks').category.slug,
+                         'django')
+
+    def test_slug_map_overflow_keeps_the_batch_slugs(self):
+        lines = []
+        for i in range(3):
+            #Every batch mentions a known category and a new one.
+            lines.append('{"category": "a1", "title": "T%d", "url": "http://a/%d"}'
+                         % (i, i))
+            lines.append('{"type": "category", "name": "b%d", "views": 3}' % i)
+        with patch.object(catalog, 'MAX_KNOWN_CATEGORIES', 2):
+            stats = catalog.import_records(catalog.read_records(lines),
+                                           batch_size=2)
+        self.assertEqual((stats.rows, stats.categories, stats.pages), (6, 4, 3))
+        self.assertEqual(Page.objects.filter(category__slug='a1').count(), 3)
+
+    def test_csv_import_through_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                         delete=False) as f:
+            f.write('category,title,url,views\n'
+                    'Python,Tutorial,http://a/,5\n'
+                    'Python,Blog,http://b/,\n')
+        self.addCleanup(os.remove, f.name)
+        call_command('import_catalog', f.name, stdout=StringIO())
+        self.assertEqual(sorted(Page.objects.values_list('title', 'views')),
+                         [('Blog', 0), ('Tutorial', 5)])
+        self.assertIn('Python', category_cache.render_sidebar())
+
+    def test_duplicate_urls_are_skipped(self):
+        python = Category.objects.create(name='Python')
+        Page.objects.create(category=python, title='Tutorial',
+                            url='http://docs.python.org/tutorial/')
+        lines = [
+            '{"category": "Python", "title": "Again", '
+            '"url": "https://DOCS.python.org/tutorial"}',
+            '{"category": "Python", "title": "Blog", "url": "http://b/"}',
+            '{"category": "Python", "title": "Blog too", "url": "http://b"}',
+            '{"category": "Django", "title": "Tutorial", '
+            '"url": "http://docs.python.org/tutorial/"}',
+        ]
+        stats = catalog.import_records(catalog.read_records(lines))
+        self.assertEqual((stats.pages, stats.duplicates), (2, 2))
+        self.assertEqual(sorted(Page.objects.values_list('title', flat=True)),
+                         ['Blog', 'Tutorial', 'Tutorial'])
+
+
+@override_settings(RANGO_VIEW_FLUSH_INTERVAL=None)
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        counters.flush()
+
+    def test_generated_catalog_is_skewed(self):
+        stats = benchmark.generate_catalog(500, categories=10)
+        self.assertEqual((stats.pages, stats.categories), (500, 10))
+        sizes = sorted((c.page_set.count() for c in Category.objects.all()),
+                       reverse=True)
+        self.assertGreater(sizes[0], 5 * sizes[-1])
+
+    def test_scenarios_report_latency_and_queries(self):
+        benchmark.generate_catalog(200, categories=10)
+        results = benchmark.run_scenarios(2, only=['index', 'sidebar'])
+        self.assertEqual([r['scenario'] for r in results],
+                         ['index', 'sidebar:cold', 'sidebar:warm'])
+        for result in results:
+            self.assertGreaterEqual(result['p99_ms'], result['p50_ms'])
+            self.assertGreater(result['peak_kib'], 0)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_server_timing_header_and_metrics_endpoint(self):
+        response = self.client.get(reverse('about'))
+        timing = response['Server-Timing']
+        self.assertIn('total;dur=', timing)
+        self.assertIn('tpl;dur=', timing)
+        self.assertRegex(timing, r'desc="[1-9]\d* queries"')
+
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('rango_request_duration_ms_count{view="about"} 1',
+                      text)
+        self.assertIn('rango_db_queries_bucket{view="about",le="+Inf"} 1',
+                      text)
+
+    def test_metrics_endpoint_hidden_when_disabled(self):
+        with self.settings(RANGO_METRICS_ENABLED=False):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.settings_override = self.settings(MEDIA_ROOT=media)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'orange').save(buffer, 'JPEG')
+        user = User.objects.create_user('rango', password='secret-pass')
+        self.profile = UserProfile.objects.create(
+            user=user, picture=SimpleUploadedFile('rango.jpg',
+                                                  buffer.getvalue()))
+
+    def test_generate_makes_small_webp_variants(self):
+        self.assertEqual(thumbnails.avatar_url(self.profile, 64),
+                         self.profile.picture.url)
+        thumbnails.generate(self.profile)
+        self.assertTrue(UserProfile.objects.get(
+            pk=self.profile.pk).has_thumbnails)
+        for size in thumbnails.sizes():
+            name = thumbnails.thumbnail_name(self.profile.picture.name, size)
+            with Image.open(os.path.join(settings.MEDIA_ROOT, name)) as thumb:
+                self.assertEqual((thumb.format, thumb.size),
+                                 ('WEBP', (size, size)))
+        self.assertTrue(thumbnails.avatar_url(self.profile, 100)
+                        .endswith('thumbs/rango_128.webp'))
+
+    def test_backfill_command(self):
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        self.assertTrue(UserProfile.objects.get(
+            pk=self.profile.pk).has_thumbnails)
+
+
+@override_settings(RANGO_USERNAME_FILTER_BACKGROUND=False)
+class UsernameFilterTests(TestCase):
+    def setUp(self):
+        usernames.reset()
+        User.objects.create_user('rango', password='secret-pass')
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = usernames.BloomFilter(100)
+        names = ['user%d' % i for i in range(100)]
+        for name in names:
+            bloom.add(name)
+        self.assertTrue(all(name in bloom for name in names))
+        misses = sum('other%d' % i in bloom for i in range(1000))
+        self.assertLess(misses, 50)
+
+    def test_unknown_names_cost_no_query(self):
+        self.assertTrue(username_present('rango'))
+        with self.assertNumQueries(0):
+            self.assertFalse(username_present('nobody'))
+
+    def test_new_and_renamed_users_are_found(self):
+        username_present('warm-up')
+        user = User.objects.create_user('tango', password='secret-pass')
+        self.assertTrue(username_present('tango'))
+        user.username = 'salsa'
+        user.save()
+        self.assertTrue(username_present('salsa'))
+        user.delete()
+        self.assertFalse(username_present('salsa'))
+
+    def test_registration_form_still_rejects_taken_names(self):
+        form = UserForm({'username': 'rango', 'email': '',
+                         'password': 'secret-pass'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('username', form.errors)
+        form = UserForm({'username': 'tango', 'email': '',
+                         'password': 'secret-pass'})
+        with self.assertNumQueries(0):
+            self.assertTrue(form.is_valid())
+
+    def test_login_with_unknown_username(self):
+        response = self.client.post(reverse('login'),
+                                    {'username': 'nobody', 'password': 'x'})
+        self.assertContains(response, 'Unregistered username supplied.')
+
+    def test_logins_do_not_fill_the_filter(self):
+        usernames.build()
+        count = usernames._filter.count
+        self.client.post(reverse('login'),
+                         {'username': 'rango', 'password': 'secret-pass'})
+        User.objects.get(username='rango').save()
+        self.assertEqual(usernames._filter.count, count)
+
+    def test_background_builds_keep_the_request_path_clear(self):
+        with self.settings(RANGO_USERNAME_FILTER_BACKGROUND=True), \
+                patch('rango.usernames._start_build') as start_build:
+            #No filter yet: the database answers and a build is started.
+            with self.assertNumQueries(1):
+                self.assertFalse(username_present('nobody'))
+            self.assertEqual(start_build.call_count, 1)
+            usernames.build()
+            with self.settings(RANGO_USERNAME_FILTER_MAX_AGE=0), \
+                    self.assertNumQueries(0):
+                #A stale filter still answers while it's rebuilt.
+                self.assertFalse(username_present('nobody'))
+            self.assertEqual(start_build.call_count, 2)
+
+
+@override_settings(RANGO_VIEW_FLUSH_INTERVAL=None)
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        self.page = Page.objects.create(category=self.python, title='Docs',
+                                        url='http://docs.python.org/')
+        self.python_url = reverse('show_category', args=['python'])
+        self.django_url = reverse('show_category', args=['django'])
+
+    def tearDown(self):
+        counters.flush()
+
+    def test_repeat_views_are_served_from_cache(self):
+        first = self.client.get(self.python_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.python_url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        #Cache hits still count as views.
+        self.assertEqual(counters.pending()[Category][self.python.id], 2)
+
+    def test_conditional_get_gets_304(self):
+        etag = self.client.get(self.python_url)['ETag']
+        response = self.client.get(self.python_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_page_write_only_evicts_its_category(self):
+        self.client.get(self.python_url)
+        self.client.get(self.django_url)
+        self.page.title = 'Python Docs'
+        with committed():
+            self.page.save()
+        self.assertContains(self.client.get(self.python_url), 'Python Docs')
+        with self.assertNumQueries(0):
+            self.client.get(self.django_url)
+
+    def test_invalidation_waits_for_the_commit(self):
+        tags = ['pages', 'category:%d' % self.python.id]
+        self.client.get(self.python_url)
+        versions = page_cache.tag_versions(tags)
+        with committed():
+            self.page.delete()
+            #Or another request could cache the uncommitted page under the
+            #new versions.
+            self.assertEqual(page_cache.tag_versions(tags), versions)
+        new = page_cache.tag_versions(tags)
+        self.assertTrue(all(new[tag] != versions[tag] for tag in tags))
+        self.assertNotContains(self.client.get(self.python_url), 'Docs')
+
+    def test_category_write_evicts_sidebar(self):
+        self.client.get(reverse('about'))
+        with committed():
+            Category.objects.create(name='Flask')
+        self.assertContains(self.client.get(reverse('about')), 'Flask')
+
+    def test_logged_in_users_are_not_cached(self):
+        user = User.objects.create_user('rango', password='secret-pass')
+        self.client.force_login(user)
+        self.client.get(self.python_url)
+        response = self.client.get(self.python_url)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class TemplateCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_compiles_every_rango_template(self):
+        templates = [dict(settings.TEMPLATES[0], APP_DIRS=False)]
+        templates[0]['OPTIONS'] = dict(templates[0]['OPTIONS'], loaders=[
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ])
+        with self.settings(TEMPLATES=templates):
+            templating.warm()
+            cached = engines['django'].engine.template_loaders[0]
+            for name in templating.template_names():
+                self.assertIn(name, cached.get_template_cache)
+
+    def test_profile_reports_templates_and_blocks(self):
+        Category.objects.create(name='Python')
+        results = templating.profile(2, ['rango/index.html'])
+        self.assertIn('rango/index.html', results['templates'])
+        self.assertIn('rango/cats.html', results['templates'])
+        self.assertIn('rango/index.html::body_block', results['blocks'])
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = Category.objects.create(name='Python', likes=3)
+        Category.objects.create(name='Django')
+        Category.objects.create(name='Flask')
+        for i in range(5):
+            Page.objects.create(category=self.python, title='Page %d' % i,
+                                url='http://example.com/%d' % i, views=i)
+
+    def get_json(self, url, **params):
+        response = self.client.get(url, params)
+        if response.streaming:
+            body = b''.join(response.streaming_content)
+        else:
+            body = response.content
+        return response, json.loads(body.decode('utf-8'))
+
+    def test_category_list_is_streamed_with_cursor(self):
+        url = reverse('api_categories')
+        response, data = self.get_json(url, limit=2, fields='name')
+        self.assertTrue(response.streaming)
+        self.assertEqual(data['results'], [{'name': 'Python'},
+                                           {'name': 'Django'}])
+        response, data = self.get_json(url, limit=2, after=data['next'])
+        self.assertEqual([c['slug'] for c in data['results']], ['flask'])
+        self.assertIsNone(data['next'])
+
+    def test_category_pages_by_views(self):
+        url = reverse('api_category_pages', args=['python'])
+        response, data = self.get_json(url, limit=3, fields='title,views')
+        self.assertEqual([p['views'] for p in data['results']], [4, 3, 2])
+        response, data = self.get_json(url, limit=3, after=data['next'])
+        self.assertEqual([p['views'] for p in data['results']], [1, 0])
+
+    def test_detail_projection_and_etag(self):
+        url = reverse('api_category', args=['python'])
+        response, data = self.get_json(url, fields='slug,likes')
+        self.assertEqual(data, {'slug': 'python', 'likes': 3})
+        response = self.client.get(url, {'fields': 'slug,likes'},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_listing_etag_changes_on_write(self):
+        url = reverse('api_category_pages', args=['python'])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                         .status_code, 304)
+        with committed():
+            Page.objects.create(category=self.python, title='New',
+                                url='http://example.com/new')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                         .status_code, 200)
+
+    def test_errors(self):
+        page = Page.objects.first()
+        response, data = self.get_json(reverse('api_page', args=[page.id]),
+                                       fields='secret')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('api_category', args=['nope']))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(reverse('api_categories'))
+        self.assertEqual(response.status_code, 405)
+
+
+@override_settings(RANGO_VIEW_FLUSH_INTERVAL=None)
+class CategoryLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = Category.objects.create(name='Python')
+        self.user = User.objects.create_user('rango', password='secret-pass')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        counters.flush()
+
+    def test_slug_map_follows_category_writes(self):
+        ref = category_cache.get_by_slug('python')
+        self.assertEqual(ref, (self.python.id, 'Python', 'python'))
+        with self.assertNumQueries(0):
+            category_cache.get_by_slug('python')
+        self.python.name = 'Python 3'
+        with committed():
+            self.python.save()
+        self.assertIsNone(category_cache.get_by_slug('python'))
+        self.assertEqual(category_cache.get_by_slug('python-3').name,
+                         'Python 3')
+        self.assertIsNone(category_cache.get_by_slug('nope'))
+
+    def test_categories_made_elsewhere_are_found(self):
+        category_cache.get_by_slug('python')
+        #As if another worker made it, this process's cache doesn't know.
+        with patch('django.db.transaction.on_commit'):
+            flask = Category.objects.create(name='Flask')
+        self.assertEqual(category_cache.get_by_slug('flask').id, flask.id)
+        #The map was brought up to date by that lookup.
+        category_cache.get_by_slug('python')
+        with self.assertNumQueries(0):
+            category_cache.get_by_slug('flask')
+        self.client.post(
+            reverse('add_page', args=['flask']),
+            {'title': 'Docs', 'url': 'http://flask.pocoo.org/', 'views': 0})
+        self.assertEqual(Page.objects.get(title='Docs').category_id, flask.id)
+
+    def test_show_category_runs_one_query(self):
+        url = reverse('show_category', args=['python'])
+        self.client.get(url)
+        #One query for the pages, the others load the session and the
+        #logged in user.
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+    def test_add_page_renders_the_category(self):
+        response = self.client.post(
+            reverse('add_page', args=['python']),
+            {'title': 'Docs', 'url': 'http://docs.python.org/', 'views': 0})
+        self.assertContains(response, 'Docs')
+        self.assertEqual(response.context['category'].id, self.python.id)
+        self.assertEqual(Page.objects.get(title='Docs').category_id,
+                         self.python.id)
+
+
+class LikeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = Category.objects.create(name='Python', likes=0)
+        self.user = User.objects.create_user('rango', password='secret-pass')
+        self.client.force_login(self.user)
+        self.url = reverse('like_category', args=['python'])
+
+    def likes(self):
+        return Category.objects.get(id=self.python.id).likes
+
+    def test_like_and_unlike(self):
+        response = self.client.post(self.url, {'action': 'like'},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json(), {'liked': True, 'likes': 1})
+        response = self.client.post(self.url, {'action': 'unlike'})
+        self.assertRedirects(response, reverse('show_category',
+                                               args=['python']))
+        self.assertEqual(self.likes(), 0)
+
+    def test_repeated_likes_cost_no_write(self):
+        self.assertTrue(likes.like(self.user, self.python.id))
+        likes.liked_ids(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertFalse(likes.like(self.user, self.python.id))
+            self.assertFalse(likes.unlike(self.user, 9999))
+        self.assertEqual(self.likes(), 1)
+
+    def test_stale_cache_cannot_double_count(self):
+        likes.like(self.user, self.python.id)
+        cache.clear()
+        CategoryLike.objects.all().delete()
+        Category.objects.update(likes=5)
+        likes.liked_ids(self.user.id)
+        CategoryLike.objects.create(user=self.user, category=self.python)
+        #The cached set says not liked, the unique constraint disagrees.
+        self.assertFalse(likes.like(self.user, self.python.id))
+        self.assertEqual(self.likes(), 5)
+        #The stale set is gone, so the like can be taken back.
+        self.assertTrue(likes.has_liked(self.user, self.python.id))
+        self.assertTrue(likes.unlike(self.user, self.python.id))
+        self.assertEqual(self.likes(), 4)
+
+    def test_noop_unlike_drops_the_cached_set(self):
+        likes.like(self.user, self.python.id)
+        likes.liked_ids(self.user.id)
+        #Unliked through another worker, whose cache this one doesn't share.
+        CategoryLike.objects.all().delete()
+        self.assertFalse(likes.unlike(self.user, self.python.id))
+        self.assertFalse(likes.has_liked(self.user, self.python.id))
+        self.assertTrue(likes.like(self.user, self.python.id))
+
+    def test_reconcile_likes(self):
+        other = User.objects.create_user('tango', password='secret-pass')
+        likes.like(self.user, self.python.id)
+        likes.like(other, self.python.id)
+        Category.objects.update(likes=40)
+        Category.objects.create(name='Django', likes=3)
+        call_command('reconcile_likes', stdout=StringIO())
+        self.assertEqual(dict(Category.objects.values_list('name', 'likes')),
+                         {'Python': 2, 'Django': 0})
+
+    def test_anonymous_users_must_log_in(self):
+        self.client.logout()
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.likes(), 0)
+
+
+class StaticDeliveryTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_collectstatic_hashes_and_precompresses(self):
+        assets = os.path.join(self.root, 'assets')
+        os.makedirs(os.path.join(assets, 'css'))
+        with open(os.path.join(assets, 'css', 'rango.css'), 'w') as handle:
+            handle.write('body { background: url("../images/rango.jpg"); }\n' * 50)
+        target = os.path.join(self.root, 'collected')
+        with self.settings(
+                STATIC_ROOT=target,
+                STATICFILES_DIRS=settings.STATICFILES_DIRS + [assets],
+                STATICFILES_STORAGE='rango.storage.CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(target, 'staticfiles.json')) as handle:
+            paths = json.load(handle)['paths']
+        css = os.path.join(target, paths['css/rango.css'])
+        self.assertTrue(os.path.exists(css + '.gz'))
+        with open(css) as handle:
+            self.assertIn(paths['images/rango.jpg'], handle.read())
+        #Images are already compressed and get no sibling
+        self.assertFalse(os.path.exists(
+            os.path.join(target, paths['images/rango.jpg']) + '.gz'))
+
+    def test_media_is_handed_to_the_front_end(self):
+        os.makedirs(os.path.join(self.root, 'profile_images'))
+        with open(os.path.join(self.root, 'profile_images', 'a b.jpg'), 'wb') as handle:
+            handle.write(b'jpeg')
+        factory = RequestFactory()
+        with self.settings(MEDIA_ROOT=self.root,
+                           RANGO_MEDIA_SENDFILE='x-accel-redirect'):
+            response = storage.serve_media(factory.get('/'), 'profile_images/a b.jpg')
+            self.assertEqual(response['X-Accel-Redirect'],
+                             '/protected-media/profile_images/a%20b.jpg')
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+            self.assertIn('max-age', response['Cache-Control'])
+            with self.assertRaises(Http404):
+                storage.serve_media(factory.get('/'), '../secret.txt')
+        with self.settings(MEDIA_ROOT=self.root, RANGO_MEDIA_SENDFILE='x-sendfile'):
+            response = storage.serve_media(factory.get('/'), 'profile_images/a b.jpg')
+            self.assertEqual(response['X-Sendfile'],
+                             os.path.join(self.root, 'profile_images', 'a b.jpg'))
+
+
+@override_settings(RANGO_DB_REPLICA='replica')
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = db.PrimaryReplicaRouter()
+        db.reset()
+        self.addCleanup(db.reset)
+
+    def test_reads_go_to_the_replica_until_a_write(self):
+        self.assertEqual(self.router.db_for_read(Category), 'replica')
+        self.assertEqual(self.router.db_for_read(User), 'replica')
+        self.assertIsNone(self.router.db_for_read(Session))
+        self.assertEqual(self.router.db_for_write(Page), 'default')
+        self.assertIsNone(self.router.db_for_read(Category))
+        self.assertFalse(self.router.allow_migrate('replica', 'rango'))
+
+    def test_middleware_pins_the_next_requests_after_a_write(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Category))
+            if request.method == 'POST':
+                self.router.db_for_write(Category)
+            return HttpResponse()
+
+        middleware = db.ReplicaPinningMiddleware(view)
+        factory = RequestFactory()
+        response = middleware(factory.post('/'))
+        cookie = response.cookies[db.PIN_COOKIE]
+        middleware(factory.get('/'))
+        request = factory.get('/')
+        request.COOKIES[db.PIN_COOKIE] = cookie.value
+        middleware(request)
+        self.assertEqual(seen, [None, 'replica', None])
+        self.assertFalse(db.is_pinned())
+
+    def test_connections_wait_for_locks(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0],
+                             settings.RANGO_SQLITE_BUSY_TIMEOUT)
+
+    def test_wal_is_opt_in(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for enabled, mode in ((False, 'delete'), (True, 'wal')):
+            name = os.path.join(directory, '%s.sqlite3' % mode)
+            other = connections['default'].__class__(
+                dict(connection.settings_dict, NAME=name), alias='other')
+            with self.settings(RANGO_SQLITE_WAL=enabled):
+                try:
+                    with other.cursor() as cursor:
+                        cursor.execute('PRAGMA journal_mode')
+                        self.assertEqual(cursor.fetchone()[0], mode)
+                finally:
+                    other.close()
+
+
+class LinkStubHandler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        if self.path == '/no-head':
+            self.send_response(405)
+        else:
+            self.send_response(404 if self.path.startswith('/gone') else 200)
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class LinkCheckTests(TestCase):
+    def setUp(self):
+        server = HTTPServer(('127.0.0.1', 0), LinkStubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base = 'http://127.0.0.1:%d' % server.server_port
+        #A port nothing listens on once the socket is closed
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        refused = 'http://127.0.0.1:%d/' % closed.getsockname()[1]
+        closed.close()
+
+        self.category = Category.objects.create(name='Python')
+        for title, url in [('ok', base + '/'), ('gone', base + '/gone'),
+                           ('no-head', base + '/no-head'),
+                           ('refused', refused)]:
+            Page.objects.create(category=self.category, title=title, url=url)
+
+    def statuses(self):
+        return dict(Page.objects.values_list('title', 'link_status'))
+
+    def test_check_links_records_status(self):
+        stats = linkcheck.check_links(concurrency=4, per_host=1, timeout=5)
+        self.assertEqual((stats.checked, stats.dead), (4, 2))
+        self.assertEqual(self.statuses(), {'ok': 200, 'gone': 404,
+                                           'no-head': 200, 'refused': 0})
+        self.assertFalse(Page.objects.filter(link_checked_at=None).exists())
+
+        #Nothing is stale straight afterwards, the next run only rechecks
+        #what has been added since.
+        Page.objects.create(category=self.category, title='new',
+                            url=Page.objects.get(title='gone').url + '/new')
+        stats = linkcheck.check_links(timeout=5)
+        self.assertEqual((stats.checked, stats.dead), (1, 1))
+        stats = linkcheck.check_links(max_age=timedelta(0), timeout=5)
+        self.assertEqual(stats.checked, 5)
+
+    def test_show_category_flags_or_hides_dead_links(self):
+        call_command('check_links', timeout=5, stdout=StringIO())
+        url = reverse('show_category', args=['python'])
+        response = self.client.get(url)
+        self.assertContains(response, 'dead-link', count=2)
+        with self.settings(RANGO_HIDE_DEAD_LINKS=True, RANGO_PAGE_CACHE_ENABLED=False):
+            response = self.client.get(url)
+        self.assertEqual([page.title for page in response.context['pages']],
+                         ['no-head', 'ok'])
+
+
+class DuplicateUrlTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.python = Category.objects.create(name='Python')
+        Page.objects.create(category=self.python, title='Tutorial',
+                            url='http://docs.python.org/tutorial/?utm_source=x#top')
+
+    def test_normalise(self):
+        same = ['https://Docs.Python.org:443/tutorial', 'docs.python.org/tutorial/',
+                'http://docs.python.org/%74utorial/']
+        for url in same:
+            self.assertEqual(urlnorm.normalise(url), 'docs.python.org/tutorial')
+        self.assertEqual(urlnorm.normalise('http://a/?b=2&a=1&utm_medium=m'),
+                         'a/?a=1&b=2')
+        self.assertNotEqual(urlnorm.url_hash('http://a/x%2Fy'),
+                            urlnorm.url_hash('http://a/x/y'))
+
+    def test_add_page_rejects_a_url_the_category_has(self):
+        user = User.objects.create_user('rango', password='secret-pass')
+        self.client.force_login(user)
+        url = reverse('add_page', args=['python'])
+        response = self.client.post(url, {'title': 'Again', 'views': 0,
+                                          'url': 'https://docs.python.org/tutorial'})
+        self.assertFormError(response, 'form', 'url',
+                             'This page is already in the category.')
+        self.client.post(url, {'title': 'Blog', 'views': 0,
+                               'url': 'https://blog.python.org/'})
+        self.assertEqual(Page.objects.get(title='Blog').url,
+                         'https://blog.python.org/')
+
+    def test_admin_form_checks_duplicates_per_category(self):
+        from django.contrib.admin.sites import site
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_superuser('admin', 'a@b.c', 'secret-pass')
+        PageAdminForm = site._registry[Page].get_form(request)
+        django = Category.objects.create(name='Django')
+        data = {'title': 'Tutorial', 'url': 'http://docs.python.org/tutorial',
+                'views': 0}
+        self.assertFalse(PageAdminForm(dict(data, category=self.python.id)).is_valid())
+        self.assertTrue(PageAdminForm(dict(data, category=django.id)).is_valid())
+        #Saving a page unchanged is not a duplicate of itself.
+        page = Page.objects.get()
+        self.assertTrue(PageAdminForm(dict(data, category=self.python.id),
+                                      instance=page).is_valid())
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('admin', 'a@b.c', 'secret-pass')
+        self.client.force_login(admin)
+        self.url = reverse('admin:rango_page_changelist')
+
+    def add_pages(self, count):
+        category = Category.objects.create(name='Category %d' % count)
+        for i in range(count):
+            Page.objects.create(category=category, title='Page %d' % i,
+                                url='http://example.com/%d/%d' % (count, i))
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.add_pages(2)
+        few = self.changelist_queries()
+        self.add_pages(30)
+        self.assertEqual(self.changelist_queries(), few)
+        response = self.client.get(reverse('admin:rango_page_add'))
+        self.assertNotContains(response, '<select name="category"')
+
+    def test_prefix_search(self):
+        self.add_pages(12)
+        response = self.client.get(self.url, {'q': 'Page 1'})
+        self.assertEqual(sorted(page.title for page in
+                                response.context['cl'].result_list),
+                         ['Page 1', 'Page 10', 'Page 11'])
+
+    def test_estimated_count(self):
+        self.add_pages(5)
+        with patch.object(pagination.EstimatedCountPaginator, 'COUNT_LIMIT', 3):
+            paginator = pagination.EstimatedCountPaginator(
+                Page.objects.order_by('id'), 2)
+            self.assertEqual(paginator.count, Page.objects.latest('id').id)
+            paginator = pagination.EstimatedCountPaginator(
+                Page.objects.filter(title__startswith='Page').order_by('id'), 2)
+            self.assertEqual(paginator.count, 3)
+
+
+@override_settings(RANGO_TRENDING_WINDOW=48, RANGO_TRENDING_HALF_LIFE=6,
+                   RANGO_VIEW_FLUSH_INTERVAL=None)
+class TrendingTests(TestCase):
+    HOUR = 500000
+
+    def setUp(self):
+        cache.clear()
+        trending.trending.invalidate()
+        self.addCleanup(trending.trending.invalidate)
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        self.old = Page.objects.create(category=self.python, title='Old',
+                                       url='http://a/')
+        self.new = Page.objects.create(category=self.django, title='New',
+                                       url='http://b/')
+
+    def views(self, hour, page, count):
+        with patch.object(trending, 'current_hour', return_value=hour):
+            counters.record_page_view(page.id, count)
+            counters.flush()
+
+    def titles(self, hour):
+        trending.trending.refresh(hour)
+        return [page['title'] for page in trending.trending._top_pages]
+
+    def test_recent_views_outrank_older_ones(self):
+        self.views(self.HOUR, self.old, 6)
+        self.views(self.HOUR, self.old, 4)
+        self.assertEqual(PageViewBucket.objects.get(page=self.old).views, 10)
+        self.assertEqual(self.titles(self.HOUR), ['Old'])
+
+        #Twelve hours (two half lives) on, 4 fresh views beat 10 old ones.
+        self.views(self.HOUR + 12, self.new, 4)
+        self.assertEqual(self.titles(self.HOUR + 12), ['New', 'Old'])
+        self.assertEqual([page['score'] for page in trending.trending._top_pages],
+                         [4, 2.5])
+        self.assertEqual([c['name'] for c in trending.trending._top_categories],
+                         ['Django', 'Python'])
+        #The incremental refreshes agree with a rebuild from scratch.
+        trending.trending.invalidate()
+        self.assertEqual(self.titles(self.HOUR + 12), ['New', 'Old'])
+
+    def test_window_expires_and_prunes_buckets(self):
+        self.views(self.HOUR, self.old, 10)
+        self.assertEqual(self.titles(self.HOUR), ['Old'])
+        self.views(self.HOUR + 40, self.new, 1)
+        self.assertEqual(self.titles(self.HOUR + 40), ['New', 'Old'])
+        self.assertEqual(self.titles(self.HOUR + 48), ['New'])
+        #Refreshing never deletes, the bucket is pruned one more window later.
+        self.assertEqual(self.titles(self.HOUR + 96), [])
+        self.assertEqual(trending.prune_expired(self.HOUR + 95), 0)
+        self.assertEqual(trending.prune_expired(self.HOUR + 96), 1)
+        self.assertEqual(list(PageViewBucket.objects.values_list('page', flat=True)),
+                         [self.new.id])
+        with patch.object(trending, 'current_hour', return_value=self.HOUR + 200):
+            call_command('prune_trending', stdout=StringIO())
+        self.assertFalse(PageViewBucket.objects.exists())
+
+    def test_expired_scores_are_dropped_after_days(self):
+        #Weeks of hourly refreshes; every page whose views have all left
+        #the window must be gone, not kept as rounding residue.
+        pages = [Page.objects.create(category=self.python, title='P%d' % i,
+                                     url='http://p/%d' % i) for i in range(20)]
+        rng = random.Random(1)
+        for step in range(24 * 14):
+            hour = self.HOUR + step
+            if step < 24 * 11:
+                trending.record(dict((page.id, rng.randint(1, 9)) for page in pages
+                                     if rng.random() < 0.3), hour)
+            trending.trending.refresh(hour)
+        self.assertEqual(trending.trending._pages, {})
+        self.assertEqual(trending.trending._categories, {})
+
+    def test_index_and_json_are_served_from_memory(self):
+        self.views(trending.current_hour(), self.new, 3)
+        response = self.client.get(reverse('trending_json'))
+        self.assertEqual([page['title'] for page in response.json()['pages']],
+                         ['New'])
+        with self.assertNumQueries(0):
+            trending.top_pages()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Trending Now')
+
+
+class CatalogExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        python = Category.objects.create(name='Python', views=128, likes=64)
+        Category.objects.create(name='Empty, "quoted"')
+        for i in range(5):
+            Page.objects.create(category=python, title='Page %d' % i,
+                                url='http://example.com/%d' % i, views=i)
+
+    def snapshot(self):
+        return (sorted(Category.objects.values_list('name', 'slug', 'views', 'likes')),
+                sorted(Page.objects.values_list('category__slug', 'title', 'url',
+                                                'views')))
+
+    def round_trip(self, format, gzipped):
+        data = b''.join(catalog.export_catalog(format, gzipped, batch_size=2))
+        before = self.snapshot()
+        Page.objects.all().delete()
+        Category.objects.all().delete()
+        stream = catalog.open_text(io.BufferedReader(io.BytesIO(data)))
+        catalog.import_records(catalog.read_records(stream, format))
+        self.assertEqual(self.snapshot(), before)
+
+    def test_round_trips_through_import(self):
+        for format in catalog.FORMATS:
+            for gzipped in (False, True):
+                self.round_trip(format, gzipped)
+
+    def test_command_writes_gzip_by_extension(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'catalog.csv.gz')
+        call_command('export_catalog', path)
+        Page.objects.all().delete()
+        call_command('import_catalog', path, stdout=StringIO())
+        self.assertEqual(Page.objects.count(), 5)
+
+    def test_endpoint_streams_to_logged_in_users(self):
+        url = reverse('export_catalog', args=['jsonl'])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        user = User.objects.create_user('rango', password='secret-pass')
+        self.client.force_login(user)
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(json.loads(lines[0])['name'], 'Python')
+        response = self.client.get(url, {'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('catalog.jsonl.gz', response['Content-Disposition'])
+
+
+@override_settings(RANGO_VIEW_FLUSH_INTERVAL=None,
+                   RANGO_USERNAME_FILTER_BACKGROUND=False)
+class LoadTestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        usernames.reset()
+        Category.objects.create(name='Python')
+        #As the test client does, keep the WSGI handler from closing the
+        #connection that holds the test's transaction.
+        request_started.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.stats = loadtest.Stats()
+        self.user = loadtest.VirtualUser(0, loadtest.WSGITransport(), self.stats,
+                                         ['python'], random.Random(0), 'test')
+
+    def tearDown(self):
+        counters.flush()
+
+    def test_flows_go_through_the_wsgi_application(self):
+        self.user.index()
+        self.user.show_category()
+        self.user.add_page()
+        self.user.add_page()
+        self.assertTrue(User.objects.filter(username=self.user.account).exists())
+        self.assertEqual(Page.objects.filter(category__slug='python').count(), 2)
+        report = self.stats.report(1.0)
+        self.assertEqual(report['errors'], 0)
+        endpoints = dict((row['endpoint'], row) for row in report['endpoints'])
+        self.assertEqual(endpoints['add_page']['requests'], 2)
+        self.assertEqual(endpoints['register']['requests'], 1)
+        self.assertEqual(endpoints['login']['requests'], 1)
+
+    def test_failures_are_counted(self):
+        self.user.slugs = ['missing']
+        self.user.request('show_category', 'GET', '/rango/nowhere/')
+        self.user.request('add_page', 'POST', '/rango/category/python/add_page/', {})
+        row = self.stats.report(1.0)['endpoints']
+        self.assertEqual([(r['endpoint'], r['errors']) for r in row],
+                         [('add_page', 1), ('show_category', 1)])
+
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('index=3, add_page=1'),
+                         {'index': 3, 'add_page': 1})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('index=1,delete_everything=1')
+
+
+class QueryProfileTests(TestCase):
+    def setUp(self):
+        self.categories = [Category.objects.create(name=name)
+                           for name in ('Python', 'Django', 'Flask')]
+        for category in self.categories:
+            Page.objects.create(category=category, title=category.name,
+                                url='http://%s.example.com/' % category.slug)
+
+    def loop(self):
+        for category in Category.objects.order_by('id'):
+            list(Page.objects.filter(category=category))
+
+    def test_shape_takes_out_the_values(self):
+        self.assertEqual(
+            queryprofile.shape("SELECT * FROM t WHERE a = %s AND b IN (%s, %s)\n"
+                               "  AND c = 'x''y' LIMIT 21"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c = ? LIMIT ?')
+
+    def test_a_query_per_row_is_flagged_with_its_caller(self):
+        with queryprofile.capture() as profile:
+            self.loop()
+        self.assertEqual(len(profile.queries), 4)
+        [(shape, queries)] = profile.repeated()
+        self.assertEqual(len(queries), 3)
+        self.assertIn('rango_page', shape)
+        self.assertRegex(queries[0].caller, r'^rango/tests\.py:\d+ in loop$')
+        self.assertEqual(profile.duplicates(), [])
+
+    def test_select_related_is_not_flagged(self):
+        with queryprofile.capture() as profile:
+            list(Page.objects.select_related('category'))
+        self.assertEqual(len(profile.queries), 1)
+        self.assertEqual(profile.repeated(), [])
+
+    def test_full_scans_are_flagged(self):
+        with queryprofile.capture() as profile:
+            list(Page.objects.filter(url='http://python.example.com/'))
+            list(Page.objects.filter(id=1))
+        [scanning] = profile.explain()
+        self.assertEqual(scanning.scans, ['rango_page'])
+        self.assertIn('url', scanning.sql)
+        self.assertTrue(all(query.plan for query in profile.queries))
+
+    def test_both_plan_formats_are_understood(self):
+        plan = ['SCAN rango_page', 'SCAN TABLE rango_category',
+                'SCAN TABLE rango_page AS U0',
+                'SCAN rango_category USING COVERING INDEX rango_category_likes',
+                'SCAN TABLE auth_user USING COVERING INDEX username',
+                'SCAN rango_page USING INDEX rango_page_views',
+                'SEARCH TABLE rango_page USING INDEX rango_page_url (url=?)',
+                'SEARCH rango_page USING INTEGER PRIMARY KEY (rowid=?)',
+                'SCAN CONSTANT ROW', 'SCAN SUBQUERY 1', 'SCAN (subquery-1)',
+                'USE TEMP B-TREE FOR ORDER BY']
+        self.assertEqual(queryprofile.full_scans(plan),
+                         ['rango_page', 'rango_category', 'rango_page',
+                          'rango_category', 'auth_user'])
+
+    @override_settings(DEBUG=True, RANGO_QUERY_PROFILE=True,
+                       RANGO_QUERY_PROFILE_HEADER=True)
+    def test_middleware_logs_and_sets_the_header(self):
+        def view(request):
+            self.loop()
+            return HttpResponse()
+
+        middleware = QueryProfilerMiddleware(view)
+        with self.assertLogs('rango.queryprofile', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/rango/'))
+        self.assertIn('possible N+1, 3 queries from rango/tests.py', logs.output[0])
+        self.assertRegex(response['X-Query-Profile'],
+                         r'^4 queries; [\d.]+ms; n\+1=3x rango/tests\.py:\d+ in loop')
+
+    @override_settings(DEBUG=True, RANGO_QUERY_PROFILE=True,
+                       RANGO_QUERY_PROFILE_HEADER=True,
+                       RANGO_VIEW_FLUSH_INTERVAL=None)
+    def test_explains_are_not_counted_in_the_metrics(self):
+        response = self.client.get(reverse('show_category', args=['python']))
+        counters.flush()
+        profiled = int(response['X-Query-Profile'].split(' ', 1)[0])
+        self.assertIn('desc="%d queries"' % profiled, response['Server-Timing'])
+
+    def test_middleware_is_off_without_debug(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryProfilerMiddleware(lambda request: HttpResponse())
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed thumbnails for UserProfile pictures.
+
+Every uploaded picture gets square WebP variants at RANGO_THUMBNAIL_SIZES,
+stored next to the original under profile_images/thumbs/. They are made by
+a small thread pool once the registration has been committed, so the
+request never waits on image work. Until they exist avatar_url() falls back
+to the original file.
+"""
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+from rango.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+
+def sizes():
+    return getattr(settings, 'RANGO_THUMBNAIL_SIZES', (64, 128, 256))
+
+def thumbnail_name(picture_name, size):
+    directory, filename = os.path.split(picture_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'thumbs', '%s_%d.webp' % (stem, size))
+
+def avatar_url(profile, size):
+    #The url of the smallest thumbnail at least size pixels wide, or of the
+    #original picture while the thumbnails are still being made.
+    if not profile or not profile.picture:
+        return ''
+    if profile.has_thumbnails:
+        fitting = [s for s in sorted(sizes()) if s >= size]
+        best = fitting[0] if fitting else max(sizes())
+        return default_storage.url(thumbnail_name(profile.picture.name,
+                                                  best))
+    return profile.picture.url
+
+def _encode(image, size):
+    thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    thumb.save(buffer, 'WEBP', quality=getattr(settings,
+                                               'RANGO_THUMBNAIL_QUALITY', 80))
+    return buffer.getvalue()
+
+def generate(profile):
+    #Writes every thumbnail for profile's picture and marks it as done.
+    if not profile.picture:
+        return False
+    with profile.picture.storage.open(profile.picture.name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    for size in sizes():
+        name = thumbnail_name(profile.picture.name, size)
+        #Storage.save() never overwrites, it picks a new name instead.
+        default_storage.delete(name)
+        default_storage.save(name, ContentFile(_encode(image, size)))
+    UserProfile.objects.filter(pk=profile.pk).update(has_thumbnails=True)
+    profile.has_thumbnails = True
+    return True
+
+def _generate_by_id(profile_id):
+    try:
+        profile = UserProfile.objects.get(pk=profile_id)
+        generate(profile)
+    except Exception:
+        logger.exception("Couldn't make thumbnails for profile %s",
+                         profile_id)
+    finally:
+        #Worker threads open their own connections, don't leave them open.
+        connections.close_all()
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RANGO_THUMBNAIL_WORKERS', 2))
+        return _executor
+
+def schedule(profile):
+    #Queues thumbnail generation for after the current transaction commits,
+    #so the worker is guaranteed to see the saved profile.
+    if profile.picture:
+        profile_id = profile.pk
+        transaction.on_commit(
+            lambda: _get_executor().submit(_generate_by_id, profile_id))
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+"Trending now" pages and categories.
+
+rango.counters adds every flushed page view to an hourly PageViewBucket.
+A page's trending score is the sum of its buckets within the last
+RANGO_TRENDING_WINDOW hours, each weighted down by half every
+RANGO_TRENDING_HALF_LIFE hours. A category scores the sum of its pages.
+
+Scores are kept in memory, multiplied by exp((hour - origin) / tau) rather
+than decayed: every score shrinks by the same factor as time passes, so
+ranking needs no rescaling, and new views just add their weight. A refresh
+(at most every RANGO_TRENDING_REFRESH seconds, on demand) only reads the
+buckets of the hours that can still change and subtracts the hours that
+fell out of the window. The top lists are worked out at refresh time, so
+serving them never touches the buckets at all. Buckets that left the window
+are deleted by the view counter flusher thread, or by
+"manage.py prune_trending", off the request path.
+"""
+
+import heapq
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+from rango.models import Category, Page, PageViewBucket
+
+#SQLite refuses statements with more than 999 parameters.
+CHUNK_SIZE = 500
+
+#Start again from a fresh origin before the scale factors get huge.
+MAX_EXPONENT = 200
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+def current_hour():
+    return int(time.time() // 3600)
+
+def _chunks(items):
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+def record(counts, hour=None):
+    #Adds page views ({page id: count}) to the hour's buckets. Called by
+    #rango.counters inside the transaction that bumps Page.views.
+    hour = current_hour() if hour is None else hour
+    page_ids = list(counts)
+    existing = set()
+    for chunk in _chunks(page_ids):
+        existing.update(PageViewBucket.objects.filter(hour=hour, page_id__in=chunk)
+                                              .values_list('page_id', flat=True))
+    by_count = {}
+    for page_id in existing:
+        by_count.setdefault(counts[page_id], []).append(page_id)
+    for count, ids in by_count.items():
+        for chunk in _chunks(ids):
+            PageViewBucket.objects.filter(hour=hour, page_id__in=chunk).update(
+                views=F('views') + count)
+
+    new = [page_id for page_id in page_ids if page_id not in existing]
+    buckets = []
+    for chunk in _chunks(new):
+        for page_id, category_id in Page.objects.filter(id__in=chunk).values_list(
+                'id', 'category_id'):
+            buckets.append(PageViewBucket(page_id=page_id, category_id=category_id,
+                                          hour=hour, views=counts[page_id]))
+    PageViewBucket.objects.bulk_create(buckets)
+
+
+class Trending(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = False
+        self._refreshed_at = 0
+        self._pages = {}
+        self._categories = {}
+        #Views already counted for the buckets that may still grow.
+        self._counted = {}
+        self._top_pages = []
+        self._top_categories = []
+
+    @property
+    def window(self):
+        return _setting('RANGO_TRENDING_WINDOW', 48)
+
+    @property
+    def tau(self):
+        return _setting('RANGO_TRENDING_HALF_LIFE', 6) / math.log(2)
+
+    def _weight(self, hour):
+        return math.exp((hour - self._origin) / self.tau)
+
+    def _add(self, row, views):
+        weight = views * self._weight(row['hour'])
+        #A view in the window weighs at least as much as one in its first
+        #hour, what's left below half that after subtracting is rounding
+        #error. The scale grows with time, so the cut-off has to as well.
+        floor = self._weight(self._start) / 2
+        for scores, key in ((self._pages, row['page_id']),
+                            (self._categories, row['category_id'])):
+            score = scores.get(key, 0) + weight
+            if score > floor:
+                scores[key] = score
+            else:
+                scores.pop(key, None)
+
+    def _rebuild(self, hour):
+        self._origin = hour
+        self._pages = {}
+        self._categories = {}
+        self._counted = {}
+        self._start = hour - self.window + 1
+        rows = PageViewBucket.objects.filter(hour__gte=self._start).values(
+            'page_id', 'category_id', 'hour', 'views')
+        for row in rows.iterator():
+            self._add(row, row['views'])
+            if row['hour'] >= hour:
+                self._counted[(row['page_id'], row['hour'])] = row['views']
+        self._hour = hour
+        self._ready = True
+
+    def _advance(self, hour):
+        #Views added since the last refresh. Only the latest hour counted
+        #can have grown since, and any hours after it are new.
+        rows = PageViewBucket.objects.filter(hour__gte=self._hour).values(
+            'page_id', 'category_id', 'hour', 'views')
+        counted = {}
+        for row in rows:
+            key = (row['page_id'], row['hour'])
+            delta = row['views'] - self._counted.get(key, 0)
+            if delta:
+                self._add(row, delta)
+            if row['hour'] >= hour:
+                counted[key] = row['views']
+        self._counted = counted
+
+        start = hour - self.window + 1
+        if start > self._start:
+            expired = PageViewBucket.objects.filter(
+                hour__gte=self._start, hour__lt=start).values(
+                'page_id', 'category_id', 'hour', 'views')
+            for row in expired:
+                self._add(row, -row['views'])
+            self._start = start
+        self._hour = hour
+
+    def refresh(self, hour=None):
+        hour = current_hour() if hour is None else hour
+        with self._lock:
+            if (not self._ready or not 0 <= hour - self._hour < self.window or
+                    (hour - self._origin) / self.tau > MAX_EXPONENT):
+                self._rebuild(hour)
+            else:
+                self._advance(hour)
+            self._refreshed_at = time.time()
+            self._rank(hour)
+
+    def _rank(self, hour):
+        size = _setting('RANGO_TRENDING_SIZE', 5)
+        #Scores as they stand now, for display.
+        scale = self._weight(hour)
+
+        def best(scores):
+            return [(key, score / scale) for key, score in
+                    heapq.nlargest(size, scores.items(), key=lambda item: item[1])]
+
+        pages = best(self._pages)
+        rows = dict((row['id'], row) for row in Page.objects.filter(
+            id__in=[key for key, score in pages]).values('id', 'title', 'url'))
+        self._top_pages = [dict(rows[key], score=round(score, 2))
+                           for key, score in pages if key in rows]
+        categories = best(self._categories)
+        rows = dict((row['id'], row) for row in Category.objects.filter(
+            id__in=[key for key, score in categories]).values('id', 'name', 'slug'))
+        self._top_categories = [dict(rows[key], score=round(score, 2))
+                                for key, score in categories if key in rows]
+
+    def _maybe_refresh(self):
+        interval = _setting('RANGO_TRENDING_REFRESH', 60)
+        if not self._ready or time.time() - self._refreshed_at > interval:
+            self.refresh()
+
+    def top_pages(self):
+        self._maybe_refresh()
+        return self._top_pages
+
+    def top_categories(self):
+        self._maybe_refresh()
+        return self._top_categories
+
+    def invalidate(self):
+        with self._lock:
+            self._ready = False
+
+
+def prune(start_hour):
+    #Drops the buckets before start_hour.
+    return PageViewBucket.objects.filter(hour__lt=start_hour).delete()[0]
+
+_pruned_hour = None
+
+def prune_expired(hour=None):
+    #Drops the buckets that are out of the window for good. Other processes
+    #may not have subtracted the hours that just left it yet, so the table
+    #keeps a second window's worth of them. Run by the view counter flusher
+    #and by "manage.py prune_trending", never by a request.
+    global _pruned_hour
+    hour = current_hour() if hour is None else hour
+    window = _setting('RANGO_TRENDING_WINDOW', 48)
+    deleted = prune(hour - 2 * window + 1)
+    _pruned_hour = hour
+    return deleted
+
+def maybe_prune():
+    #At most once an hour, that's how often buckets expire.
+    if _pruned_hour != current_hour():
+        prune_expired()
+
+trending = Trending()
+
+def top_pages():
+    return trending.top_pages()
+
+def top_categories():
+    return trending.top_categories()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Canonical page urls, for spotting duplicates.
+
+normalise() maps the different spellings of one address onto the same
+string: the scheme is dropped (http and https count as one page), the host
+is lowercased without a default port or trailing dot, escapes of unreserved
+characters are decoded, a trailing slash and the fragment are dropped, and
+query parameters are sorted with utm_* tracking parameters removed.
+
+url_hash() is a signed 64 bit digest of that, stored as Page.url_hash and
+indexed together with the category, so whether a category already has a
+url is one index probe however many pages it holds.
+"""
+
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+TRACKING_PREFIXES = ('utm_',)
+
+_escape = re.compile(r'%([0-9A-Fa-f]{2})')
+_UNRESERVED = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+                        '0123456789-._~')
+
+def _unescape(match):
+    #Only unreserved characters are safe to decode, %2F is not a slash.
+    char = chr(int(match.group(1), 16))
+    if char in _UNRESERVED:
+        return char
+    return '%' + match.group(1).upper()
+
+def normalise(url):
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    host = (parts.hostname or '').rstrip('.')
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = '%s:%d' % (host, port)
+
+    path = _escape.sub(_unescape, parts.path) or '/'
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not key.lower().startswith(TRACKING_PREFIXES)]
+    query = urlencode(sorted(query))
+
+    return host + path + ('?' + query if query else '')
+
+def url_hash(url):
+    digest = hashlib.blake2b(normalise(url).encode('utf-8'), digest_size=8).digest()
+    #Signed, so it fits a 64 bit integer column.
+    return int.from_bytes(digest, 'big', signed=True)
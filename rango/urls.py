@@ -9,7 +9,7 @@ Created on Mon Jan 21 16:39:37 2019
 "@author: thero"
 
 from django.conf.urls import url
-from rango import views
+from rango import api, views
 
 urlpatterns = [
         url(r'^$', views.index, name = 'index'),
@@ -17,8 +17,24 @@ urlpatterns = [
         url(r'^add_category/$', views.add_category, name='add_category'),
         url(r'^category/(?P<category_name_slug>[\w\-]+)/add_page/$', 
             views.add_page, name='add_page'),
+        url(r'^category/(?P<category_name_slug>[\w\-]+)/like/$',
+            views.like_category, name='like_category'),
         url(r'^category/(?P<category_name_slug>[\w\-]+)/$', 
             views.show_category, name='show_category'),
+        url(r'^goto/(?P<page_id>\d+)/$', views.goto_url, name='goto'),
+        url(r'^search/$', views.search_pages, name='search'),
+        url(r'^search\.json$', views.search_json, name='search_json'),
+        url(r'^trending\.json$', views.trending_json, name='trending_json'),
+        url(r'^export/catalog\.(?P<format>jsonl|csv)$', views.export_catalog,
+            name='export_catalog'),
+        url(r'^metrics/$', views.metrics_text, name='metrics'),
+        url(r'^api/categories/$', api.category_list, name='api_categories'),
+        url(r'^api/categories/(?P<category_name_slug>[\w\-]+)/$',
+            api.category_detail, name='api_category'),
+        url(r'^api/categories/(?P<category_name_slug>[\w\-]+)/pages/$',
+            api.category_pages, name='api_category_pages'),
+        url(r'^api/pages/(?P<page_id>\d+)/$', api.page_detail,
+            name='api_page'),
         url(r'^register/$',
             views.register,
             name='register'),
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Fast "is this username taken?" checks.
+
+A Bloom filter over every username answers most lookups for names that
+don't exist without touching the database; when the filter says a name may
+exist the database gives the exact answer. The filter is warmed when the
+WSGI application loads, kept current from User signals and rebuilt when it
+gets too full, after enough deletions, or after
+RANGO_USERNAME_FILTER_MAX_AGE seconds so users created by other processes
+are picked up.
+
+Builds read the whole auth_user table, so they run on a background thread
+and lookups keep using the old filter, or the database while there is none
+yet. With RANGO_USERNAME_FILTER_BACKGROUND off they run inline instead.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter(object):
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = int(math.ceil(-capacity * math.log(error_rate) /
+                                  math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        #Double hashing: k positions from two 64-bit halves of one digest.
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+_filter = None
+_built_at = 0
+_deleted = 0
+#Names added while a rebuild is reading the table, so none get lost.
+_added_during_build = None
+
+def _error_rate():
+    return getattr(settings, 'RANGO_USERNAME_FILTER_ERROR_RATE', 0.01)
+
+def _needs_build():
+    if _filter is None:
+        return True
+    max_age = getattr(settings, 'RANGO_USERNAME_FILTER_MAX_AGE', 300)
+    if max_age is not None and time.time() - _built_at > max_age:
+        return True
+    return (_filter.count > _filter.capacity or
+            _deleted > _filter.capacity // 4)
+
+def _background():
+    return getattr(settings, 'RANGO_USERNAME_FILTER_BACKGROUND', True)
+
+def build():
+    #One rebuild at a time, they share _added_during_build.
+    with _build_lock:
+        _build()
+
+def _build_in_background():
+    try:
+        _build()
+    except Exception:
+        logger.exception("Failed to build the username filter")
+    finally:
+        _build_lock.release()
+        #The thread's own connection.
+        connections.close_all()
+
+def _start_build():
+    #Rebuilds on a background thread, unless a rebuild is already running.
+    if not _build_lock.acquire(blocking=False):
+        return
+    try:
+        thread = threading.Thread(target=_build_in_background,
+                                  name='rango-username-filter')
+        thread.daemon = True
+        thread.start()
+    except Exception:
+        _build_lock.release()
+        raise
+
+def warm():
+    #Starts building the filter ahead of the first login or registration.
+    if _background() and _filter is None:
+        _start_build()
+
+def _build():
+    global _filter, _built_at, _deleted, _added_during_build
+    with _lock:
+        _added_during_build = []
+    try:
+        names = User.objects.values_list('username', flat=True)
+        #Room to grow before the filter has to be rebuilt.
+        bloom = BloomFilter(max(2 * names.count(), 1000), _error_rate())
+        for name in names.iterator():
+            bloom.add(name)
+    except Exception:
+        with _lock:
+            _added_during_build = None
+        raise
+    with _lock:
+        for name in _added_during_build:
+            bloom.add(name)
+        _added_during_build = None
+        _filter = bloom
+        _built_at = time.time()
+        _deleted = 0
+
+def might_exist(username):
+    #False means the username definitely isn't taken. Every name might be
+    #while the first build is still running.
+    if _needs_build():
+        if _background():
+            _start_build()
+        else:
+            with _build_lock:
+                #Another request may have rebuilt it while we waited.
+                if _needs_build():
+                    _build()
+    bloom = _filter
+    return bloom is None or username in bloom
+
+def exists(username):
+    return might_exist(username) and \
+        User.objects.filter(username=username).exists()
+
+def added(username):
+    with _lock:
+        if _added_during_build is not None:
+            _added_during_build.append(username)
+        #A name that's already in sets no new bits, so it mustn't count
+        #towards filling the filter up.
+        if _filter is not None and username not in _filter:
+            _filter.add(username)
+
+def deleted(username):
+    #Bloom filters can't forget, a deleted name just costs one exact check
+    #until the next rebuild.
+    global _deleted
+    with _lock:
+        _deleted += 1
+
+def reset():
+    global _filter
+    with _lock:
+        _filter = None
@@ -1,21 +1,50 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import (HttpResponse, HttpResponseRedirect, JsonResponse,
+                         Http404, StreamingHttpResponse)
 from django.core.urlresolvers import reverse
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from django.contrib.auth.decorators import login_required
-from rango.models import Category, Page
+from django.views.decorators.http import require_POST
+from rango.models import Page
 from rango.forms import CategoryForm, PageForm, UserForm, UserProfileForm
+from rango import (catalog, category_cache, counters, leaderboard, likes,
+                   linkcheck, metrics, pagination, search, thumbnails,
+                   trending, usernames)
+from rango.page_cache import cache_anonymous_page, tag_response
 from datetime import datetime
 
+#Anonymous visitors to index, about and show_category get cached pages.
+#The visitor count still has to be kept up to date on every request, and
+#about shows it, so it's part of that page's cache key.
+def _track_visitor(request):
+    visitor_cookie_handler(request)
+    return ''
+
+def _track_and_show_visits(request):
+    visitor_cookie_handler(request)
+    return str(request.session['visits'])
+
+def _count_cached_category_view(request, tags, category_name_slug):
+    for tag in tags:
+        if tag.startswith('category:'):
+            counters.record_category_view(int(tag.split(':')[1]))
+
+@cache_anonymous_page(prepare=_track_visitor)
 def index(request):
-    request.session.set_test_cookie()
-    #Queries the database for a list of ALL categories currently stored. Then 
-    #order them by the number of likes in descending order, hiding any with 
-    #less than 5 likes.
-    category_list = Category.objects.order_by('-likes')[:5]
-    page_list = Page.objects.order_by('-views')[:5]
+    #Only set the test cookie if it isn't there already, setting it again
+    #would mark the session modified and cost a write on every hit.
+    if not request.session.test_cookie_worked():
+        request.session.set_test_cookie()
+    #The five most liked categories and most viewed pages. These come from
+    #the in-memory leaderboards, which are kept up to date as the counters
+    #change, so we don't sort the tables on every hit.
+    category_list = leaderboard.top_categories()
+    page_list = leaderboard.top_pages()
     context_dict = {'categories': category_list, 'pages': page_list}
+    #Pages getting the most views lately, also kept in memory.
+    context_dict['trending'] = trending.top_pages()
     
     #Call the helper function to handle the cookies
     visitor_cookie_handler(request)
@@ -24,11 +53,13 @@ def index(request):
     #Obtain our Response object early so we can add cookie information.
     response = render(request, 'rango/index.html', context_dict)
     
-   
+    #The sidebar and the leaderboards show categories and pages.
+    tag_response(response, 'categories', 'pages')
     
     #Return response back to the user, updating any cookies that need changed.
     return response
 
+@cache_anonymous_page(prepare=_track_and_show_visits)
 def about(request):
     if request.session.test_cookie_worked():
         print("TEST COOKIE WORKED!")
@@ -36,31 +67,139 @@ def about(request):
     
     visitor_cookie_handler(request)
     context_dict = {'visits': request.session['visits']}
-    return render(request, 'rango/about.html', context_dict)
+    response = render(request, 'rango/about.html', context_dict)
+    return tag_response(response, 'categories')
 
+@cache_anonymous_page(on_hit=_count_cached_category_view)
 def show_category(request, category_name_slug):
+    #Looks the slug up in the in-memory category map, so this costs no
+    #query. We get None back if there's no such category.
+    category = category_cache.get_by_slug(category_name_slug)
+    
+    if category:
+        #Count the visit. This only goes into the in-memory buffer, the
+        #database is updated in batches by the background flusher.
+        counters.record_category_view(category.id)
+    
+    return _render_category(request, category)
+
+def _render_category(request, category):
     context_dict = {}
     
-    try:
-        #Checks if there's a category slug with the given name and returns an 
-        #instance if there is and raises an exception if there isn't one.
-        category = Category.objects.get(slug=category_name_slug)
-        
-        #Retrieve all associated pages.
-        pages = Page.objects.filter(category=category)
+    if category:
+        #Retrieve one page of the associated pages, most viewed first. We
+        #seek from the cursor in the url rather than using an offset so
+        #deep pages of big categories are as cheap as the first. This is
+        #the only query the category page runs.
+        pages = Page.objects.filter(category_id=category.id)
+        if settings.RANGO_HIDE_DEAD_LINKS:
+            pages = linkcheck.alive(pages)
+        pages = pagination.paginate(pages, ('-views', '-id'),
+                                    settings.RANGO_CATEGORY_PAGE_SIZE,
+                                    after=request.GET.get('after'),
+                                    before=request.GET.get('before'))
         
         #Add the pages to the template context.
         context_dict['pages'] = pages
-        #We also add the category object from the db to the context.
+        #We also add the category to the context.
         context_dict['category'] = category
-    except Category.DoesNotExist:
+        #Whether to offer like or unlike. Only logged in users see this and
+        #their pages aren't cached.
+        context_dict['liked'] = likes.has_liked(request.user, category.id)
+    else:
         #We get here if the specified isn't found
         #A default "no category" is displayed.
         context_dict['category'] = None
         context_dict['pages'] = None
         
     #Go render the response and return it to the client.
-    return render(request, 'rango/category.html', context_dict)
+    response = render(request, 'rango/category.html', context_dict)
+    tag_response(response, 'categories')
+    if category:
+        tag_response(response, 'category:%d' % category.id)
+    return response
+
+@login_required
+@require_POST
+def like_category(request, category_name_slug):
+    category = category_cache.get_by_slug(category_name_slug)
+    if category is None:
+        raise Http404
+    
+    if request.POST.get('action') == 'unlike':
+        likes.unlike(request.user, category.id)
+    else:
+        likes.like(request.user, category.id)
+    
+    #AJAX callers get the new state back, a plain form post goes back to
+    #the category page.
+    if request.is_ajax():
+        return JsonResponse({'liked': likes.has_liked(request.user,
+                                                      category.id),
+                             'likes': likes.likes_of(category.id)})
+    return HttpResponseRedirect(reverse('show_category',
+                                        args=[category.slug]))
+
+def goto_url(request, page_id):
+    #Sends the user on to the page's url, counting the click-through.
+    try:
+        url = Page.objects.values_list('url', flat=True).get(id=page_id)
+    except Page.DoesNotExist:
+        return HttpResponseRedirect(reverse('index'))
+    
+    counters.record_page_view(int(page_id))
+    return HttpResponseRedirect(url)
+
+def _search_results(request):
+    query = request.GET.get('query', '').strip()
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+    return search.search(query, page)
+
+def search_pages(request):
+    results = _search_results(request)
+    return render(request, 'rango/search.html', {'results': results})
+
+def search_json(request):
+    results = _search_results(request)
+    return JsonResponse({'query': results.query,
+                         'page': results.page,
+                         'has_next': results.has_next,
+                         'categories': results.categories,
+                         'pages': results.pages})
+
+def trending_json(request):
+    #The pages and categories getting the most views lately, best first.
+    return JsonResponse({'pages': trending.top_pages(),
+                         'categories': trending.top_categories()})
+
+@login_required
+def export_catalog(request, format):
+    #Streams every category and page in the format import_catalog reads,
+    #gzipped with ?gzip=1. Rows are read in batches as the response is
+    #sent, so memory use doesn't depend on the size of the catalog.
+    gzipped = request.GET.get('gzip') == '1'
+    filename = 'catalog.' + format
+    if gzipped:
+        content_type = 'application/gzip'
+        filename += '.gz'
+    elif format == 'csv':
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content_type = 'application/x-ndjson; charset=utf-8'
+    response = StreamingHttpResponse(catalog.export_catalog(format, gzipped),
+                                     content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+def metrics_text(request):
+    #The request histograms in the Prometheus text format.
+    if not metrics.is_enabled():
+        raise Http404
+    return HttpResponse(metrics.render_text(),
+                        content_type='text/plain; version=0.0.4')
 
 @login_required
 def add_category(request):
@@ -86,22 +225,23 @@ def add_category(request):
 
 @login_required
 def add_page(request, category_name_slug):
-    try:
-        category = Category.objects.get(slug=category_name_slug)
-    except Category.DoesNotExist:
-        category = None
+    category = category_cache.get_by_slug(category_name_slug)
         
-    form = PageForm()
+    #The form rejects a url the category already has, so it needs to know
+    #the category before it is validated.
+    instance = Page(category_id=category.id) if category else None
+    form = PageForm(instance=instance)
     if request.method == "POST":
-        form = PageForm(request.POST)
+        form = PageForm(request.POST, instance=instance)
         
         if form.is_valid():
             if category:
                 page = form.save(commit=False)
-                page.category = category
                 page.views = 0
                 page.save()
-                return show_category(request, category_name_slug)
+                #Show the category with the category we already have,
+                #rather than going through show_category to look it up.
+                return _render_category(request, category)
         else:
             print(form.errors)
             
@@ -118,8 +258,20 @@ def register(request):
         profile_form = UserProfileForm(data=request.POST)
         
         if user_form.is_valid() and profile_form.is_valid():
-            #Save the user's form data to the database.
-            user = user_form.save()
+            #Save the user's form data to the database. The username
+            #check in UserForm can miss a name another process registered
+            #moments ago, the unique constraint catches that.
+            try:
+                with transaction.atomic():
+                    user = user_form.save()
+            except IntegrityError:
+                user_form.add_error('username', "A user with that username "
+                                                "already exists.")
+                return render(request,
+                              'rango/register.html',
+                              {'user_form': user_form,
+                               'profile_form': profile_form,
+                               'registered': registered})
             
             #Now we hash the password with the set_password method.
             #Once hashed, we can update the user object.
@@ -140,6 +292,10 @@ def register(request):
             #Now we save the UserProfile model instance.
             profile.save()
             
+            #The thumbnails are made in the background once this request
+            #is done, so registering doesn't wait on image processing.
+            thumbnails.schedule(profile)
+            
             #Update out boolean to show that registration was successful.
             registered = True
         
@@ -213,10 +369,9 @@ def user_logout(request):
     return HttpResponseRedirect(reverse('index'))
 
 #Method to determine whether a username is already in use or not.
+#Names that were never registered are answered from memory.
 def username_present(username):
-    if User.objects.filter(username=username).exists():
-        return True
-    return False
+    return usernames.exists(username)
 
 def get_server_side_cookie(request, cookie, default_val=None):
     val = request.session.get(cookie)
@@ -236,17 +391,21 @@ def visitor_cookie_handler(request):
     last_visit_time = datetime.strptime(last_visit_cookie[:-7],
                                         '%Y-%m-%d %H:%M:%S')
     
+    #Assigning to the session marks it modified, which costs a database
+    #write at the end of the request, so we only do so when a value has
+    #actually changed.
     #If it's been more than a day since the last visit...
     if(datetime.now() - last_visit_time).days > 0:
         visits += 1
         #Update the last visit cookie now that we have updated the count
         request.session['last_visit'] =  str(datetime.now())
-    else:
-        #Set the last visit cookie
+    elif 'last_visit' not in request.session:
+        #Set the last visit cookie on the first visit
         request.session['last_visit'] = last_visit_cookie 
         
     #Update/set the visits cookie
-    request.session['visits'] = visits
+    if request.session.get('visits') != visits:
+        request.session['visits'] = visits
  
     
 
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
@@ -41,10 +43,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'rango',
+    'rango.apps.RangoConfig',
 ]
 
 MIDDLEWARE = [
+    #Outside the metrics, so its EXPLAIN queries aren't counted there.
+    'rango.middleware.QueryProfilerMiddleware',
+    'rango.middleware.RequestMetricsMiddleware',
+    'rango.db.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +79,21 @@ TEMPLATES = [
     },
 ]
 
+#Keep compiled templates in memory instead of re-reading and re-parsing
+#them (and the base.html chain they extend) on every render. On by default
+#whenever DEBUG is off; RangoConfig compiles every rango template at
+#startup so the first requests don't pay for it either.
+RANGO_TEMPLATE_CACHE = not DEBUG
+
+if RANGO_TEMPLATE_CACHE:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'tango_with_django_project.wsgi.application'
 
 
@@ -83,9 +104,139 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        #Keep connections open between requests instead of reconnecting
+        'CONN_MAX_AGE': 60,
     }
 }
 
+#Optional read replica. Reads of rango and auth models go there, writes and
+#anything read shortly after a write go to 'default' (see rango/db.py).
+#For local testing point RANGO_DB_REPLICA_NAME at a second SQLite file and
+#refresh it from the primary with `manage.py sync_replica`.
+RANGO_DB_REPLICA = None
+if os.environ.get('RANGO_DB_REPLICA_NAME'):
+    RANGO_DB_REPLICA = 'replica'
+    DATABASES[RANGO_DB_REPLICA] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['RANGO_DB_REPLICA_NAME'],
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['rango.db.PrimaryReplicaRouter']
+
+#How long (in seconds) a user's reads stay on the primary after they wrote
+RANGO_REPLICA_PIN_SECONDS = 5
+
+#Every SQLite connection waits up to this many milliseconds for a lock
+#instead of failing straight away.
+RANGO_SQLITE_BUSY_TIMEOUT = 5000
+
+#Set RANGO_SQLITE_WAL in the environment to switch SQLite connections to
+#write-ahead logging, so reads don't wait for writes. WAL is recorded in the
+#database file itself and leaves -wal/-shm files next to it, so it is off
+#for the db.sqlite3 checked into the repository.
+RANGO_SQLITE_WAL = bool(os.environ.get('RANGO_SQLITE_WAL'))
+
+
+# Caches
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rango',
+    }
+}
+
+#How long (in seconds) the cached category list and sidebar fragments live.
+#Saving or deleting a Category invalidates them straight away regardless.
+RANGO_CATEGORY_CACHE_TIMEOUT = 3600
+
+#Index page leaderboards. SIZE rows are shown, SLACK extra rows are kept in
+#memory so that counters dropping off the bottom rarely force a reload.
+#Each process keeps its own boards; with several workers set MAX_AGE (in
+#seconds) so they also pick up counter changes made by the others.
+RANGO_LEADERBOARD_SIZE = 5
+RANGO_LEADERBOARD_SLACK = 20
+RANGO_LEADERBOARD_MAX_AGE = None
+
+#Page and category views are buffered in memory and written in batches.
+#The buffer is flushed every FLUSH_INTERVAL seconds (0 or None disables the
+#background flusher) or as soon as it holds BUFFER_SIZE rows.
+RANGO_VIEW_FLUSH_INTERVAL = 5
+RANGO_VIEW_BUFFER_SIZE = 1000
+
+#Trending pages and categories: views in the last WINDOW hours, each
+#hour's views counting half as much after HALF_LIFE hours. Each process
+#re-reads the latest hourly buckets at most every REFRESH seconds.
+RANGO_TRENDING_SIZE = 5
+RANGO_TRENDING_WINDOW = 48
+RANGO_TRENDING_HALF_LIFE = 6
+RANGO_TRENDING_REFRESH = 60
+
+#Results per page for the full-text search.
+RANGO_SEARCH_PAGE_SIZE = 20
+
+#Pages listed per page of show_category.
+RANGO_CATEGORY_PAGE_SIZE = 20
+
+#Leave pages whose last check_links run found them dead out of
+#show_category altogether, rather than just flagging them.
+RANGO_HIDE_DEAD_LINKS = False
+
+#Per-request timings in Server-Timing headers and histograms at
+#/rango/metrics/. When off the middleware removes itself entirely.
+RANGO_METRICS_ENABLED = True
+
+#Debug only: group each request's queries by shape, warn about any shape run
+#RANGO_QUERY_PROFILE_REPEAT or more times from one line (N+1 candidates) and
+#EXPLAIN the RANGO_QUERY_PROFILE_EXPLAIN slowest queries to catch full table
+#scans. The findings go to the rango.queryprofile logger, and also to an
+#X-Query-Profile response header with RANGO_QUERY_PROFILE_HEADER.
+RANGO_QUERY_PROFILE = DEBUG
+RANGO_QUERY_PROFILE_REPEAT = 3
+RANGO_QUERY_PROFILE_EXPLAIN = 3
+RANGO_QUERY_PROFILE_HEADER = True
+
+#Square WebP thumbnails made for every profile picture, and how many
+#background threads make them.
+RANGO_THUMBNAIL_SIZES = (64, 128, 256)
+RANGO_THUMBNAIL_QUALITY = 80
+RANGO_THUMBNAIL_WORKERS = 2
+
+#In-memory username filter used by login and registration. It's rebuilt
+#after MAX_AGE seconds to pick up users created by other processes, on a
+#background thread unless BACKGROUND is off.
+RANGO_USERNAME_FILTER_ERROR_RATE = 0.01
+RANGO_USERNAME_FILTER_MAX_AGE = 300
+RANGO_USERNAME_FILTER_BACKGROUND = True
+
+#Cached pages for anonymous visitors. Writes evict the affected pages
+#straight away, the timeout bounds how stale view counts can get.
+RANGO_PAGE_CACHE_ENABLED = True
+RANGO_PAGE_CACHE_TIMEOUT = 300
+
+#How long (in seconds) each user's set of liked categories is cached. Other
+#workers' likes show up in this worker's cache after at most this long.
+RANGO_LIKES_CACHE_TIMEOUT = 300
+
+
+# Sessions
+# https://docs.djangoproject.com/en/1.11/topics/http/sessions/
+
+#Sessions live in the database; visitor_cookie_handler only saves them when
+#a visit is counted. Set RANGO_SESSION_ENGINE to 'signed_cookies' to keep no
+#server side state at all. 'cache' and 'cached_db' need CACHES to point at a
+#cache that is shared by every worker (e.g. memcached): with the per-process
+#LocMemCache a logout in one worker leaves the session alive in the others.
+RANGO_SESSION_ENGINE = os.environ.get('RANGO_SESSION_ENGINE', 'db')
+if (RANGO_SESSION_ENGINE in ('cache', 'cached_db') and
+        CACHES['default']['BACKEND'].endswith('.LocMemCache')):
+    raise ImproperlyConfigured(
+        "RANGO_SESSION_ENGINE=%s needs a cache shared by every worker, "
+        "not LocMemCache" % RANGO_SESSION_ENGINE)
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + RANGO_SESSION_ENGINE
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -130,11 +281,28 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+#collectstatic target, served by the front-end server (see rango/storage.py
+#for the nginx config). Outside DEBUG the files are content-hashed and
+#precompressed so they can be cached with a far-future expiry.
+STATIC_ROOT = os.environ.get('RANGO_STATIC_ROOT', os.path.join(BASE_DIR, 'static_root'))
+RANGO_HASHED_STATIC = not DEBUG
+if RANGO_HASHED_STATIC:
+    STATICFILES_STORAGE = 'rango.storage.CompressedManifestStaticFilesStorage'
+
 #Media files
 
 MEDIA_ROOT = MEDIA_DIR
 MEDIA_URL =  '/media/'
 
+#How uploads are handed to the front-end server: None (Django's static()
+#helper, DEBUG only), 'x-sendfile' or 'x-accel-redirect'. With
+#x-accel-redirect the file is requested from RANGO_MEDIA_ACCEL_PREFIX, which
+#must be an internal location aliased to MEDIA_ROOT.
+RANGO_MEDIA_SENDFILE = os.environ.get('RANGO_MEDIA_SENDFILE') or None
+RANGO_MEDIA_ACCEL_PREFIX = '/protected-media/'
+#Uploads keep their names, so they get a bounded rather than immutable expiry
+RANGO_MEDIA_MAX_AGE = 60 * 60 * 24
+
 #Login redirect
 
 LOGIN_URL = '/rango/login/'
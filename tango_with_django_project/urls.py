@@ -19,6 +19,7 @@ from django.conf.urls import include
 from rango import views
 from django.conf import settings
 from django.conf.urls.static import static
+from rango import storage
 
 urlpatterns  =[
         url(r'^$', views.index, name='index'),
@@ -27,5 +28,12 @@ urlpatterns  =[
         # with rango/ to be handled by
         # the rango application.
         url(r'^admin/', admin.site.urls),
-        ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+        ]
+
+if settings.RANGO_MEDIA_SENDFILE:
+    urlpatterns += [
+        url(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), storage.serve_media),
+        ]
+else:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tango_with_django_project.settings")
 
 application = get_wsgi_application()
+
+#Build the username filter before the first login or registration needs it.
+from rango import usernames  # noqa: E402
+usernames.warm()